@@ -1,19 +1,53 @@
+import bz2
+import gzip
 import io
 import json
-from collections import defaultdict
+import lzma
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from copy import deepcopy
-from functools import cache
-from itertools import chain, count
+from functools import cache, partial
+from heapq import merge
+from itertools import chain, count, groupby, islice
 
 from django.apps import apps
 from django.conf import settings
 from django.core import serializers
 from django.core.management.color import no_style
-from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    IntegrityError,
+    connections,
+    router,
+    transaction,
+)
+from django.db.models import (
+    DateField,
+    DateTimeField,
+    Exists,
+    Field,
+    FileField,
+    OuterRef,
+    TimeField,
+)
 from django.utils.crypto import get_random_string
 from django.utils.module_loading import import_string
 
-from feincms3_data.serializers import JSONEncoder, JSONSerializer
+from feincms3_data.serializers import (
+    M2M_PKS_ATTRIBUTE,
+    ColumnarSerializer,
+    JSONEncoder,
+    JSONLSerializer,
+    JSONSerializer,
+)
 
 
 def datasets():
@@ -47,6 +81,10 @@ class InvalidSpecError(Exception):
     pass
 
 
+class InvalidDumpError(Exception):
+    pass
+
+
 _valid_keys = {
     "model",
     "filter",
@@ -55,6 +93,7 @@ _valid_keys = {
     "ignore_missing_m2m",
     "save_as_new",
     "defer_values",
+    "delta",
 }
 
 
@@ -63,6 +102,15 @@ def _validate_spec(spec):
         raise InvalidSpecError(f"The spec {spec!r} requires a 'model' key")
     if unknown := (set(spec.keys()) - _valid_keys):
         raise InvalidSpecError(f"The spec {spec!r} contains unknown keys: {unknown!r}")
+    if delta := spec.get("delta"):
+        if not isinstance(delta, dict) or set(delta) != {"field", "since"}:
+            raise InvalidSpecError(
+                f"The spec {spec!r} requires 'field' and 'since' keys for 'delta'"
+            )
+        if spec.get("save_as_new"):
+            raise InvalidSpecError(
+                f"The spec {spec!r} cannot use 'delta' together with 'save_as_new'"
+            )
     return spec
 
 
@@ -86,114 +134,1018 @@ def _model_queryset(spec):
     return queryset
 
 
+def _dump_queryset(spec):
+    queryset = _model_queryset(spec).distinct()
+    if delta := spec.get("delta"):
+        queryset = queryset.filter(**{f"{delta['field']}__gte": delta["since"]})
+    return queryset
+
+
+def _dump_objects(spec, *, chunk_size):
+    """Yield the objects of a spec with the primary keys of their m2m relations"""
+    queryset = _dump_queryset(spec)
+    objects = queryset.iterator(chunk_size=chunk_size)
+    fields = [
+        f
+        for f in queryset.model._meta.local_many_to_many
+        if f.remote_field.through._meta.auto_created
+    ]
+    if not fields:
+        yield from objects
+        return
+
+    max_query_params = connections[queryset.db].features.max_query_params
+    for batch in _batched(objects, min(chunk_size, max_query_params or chunk_size)):
+        pks = [obj.pk for obj in batch]
+        related = {}
+        for f in fields:
+            source, target = f.m2m_field_name(), f.m2m_reverse_field_name()
+            related[f.name] = field_pks = defaultdict(list)
+            queryset = f.remote_field.through._base_manager.filter(
+                **{f"{source}__in": pks}
+            )
+            # Same rows and ordering as the related manager used by Django
+            if (targets := f.related_model._default_manager.all()).query.has_filters():
+                queryset = queryset.filter(**{f"{target}__in": targets.values("pk")})
+            for pk, related_pk in queryset.order_by(target).values_list(source, target):
+                field_pks[pk].append(related_pk)
+        for obj in batch:
+            setattr(
+                obj,
+                M2M_PKS_ATTRIBUTE,
+                {name: field_pks[obj.pk] for name, field_pks in related.items()},
+            )
+            yield obj
+
+
+def _existing_pks(specs):
+    """Return the primary keys of delta specs with ``delete_missing``"""
+    return [
+        list(_model_queryset(spec).values_list("pk", flat=True))
+        if spec.get("delta") and spec.get("delete_missing")
+        else None
+        for spec in specs
+    ]
+
+
 def silence(*a):
     pass
 
 
-def dump_specs(specs, *, mappers=None, objects=None):
+def _size(data):
+    """Return the UTF-8 encoded size of ``data`` without encoding ASCII"""
+    return len(data) if data.isascii() else len(data.encode())
+
+
+class _Instrument:
+    """
+    Report phases of dumping and loading as event dicts to ``events``
+
+    With ``trace_memory=True`` the traced memory peak is reset per phase.
+    """
+
+    def __init__(self, events, *, size=None, trace_memory=False):
+        self._events = events
+        self._size = size
+        self._trace_memory = trace_memory
+        self.queries = 0
+
+    def _count(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def count_queries(self, using):
+        return connections[using].execute_wrapper(self._count)
+
+    def start(self):
+        if self._trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        return time.perf_counter(), self.queries, self._size() if self._size else 0
+
+    def report(self, phase, start, **data):
+        event = {
+            "phase": phase,
+            **data,
+            "duration": time.perf_counter() - start[0],
+            "queries": self.queries - start[1],
+        }
+        if self._size:
+            event["bytes"] = self._size() - start[2]
+        if self._trace_memory and tracemalloc.is_tracing():
+            event["memory_peak"] = tracemalloc.get_traced_memory()[1]
+        self.emit(event)
+
+    def emit(self, event):
+        self._events(event)
+
+    @contextmanager
+    def phase(self, phase, **data):
+        start = self.start()
+        yield data
+        self.report(phase, start, **data)
+
+    def iterate(self, phase, iterable, **data):
+        start = self.start()
+        objects = 0
+        for obj in iterable:
+            objects += 1
+            yield obj
+        self.report(phase, start, **data, objects=objects)
+
+
+class _CountingWriter:
+    """Count the UTF-8 encoded size of the data written to a text stream"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.size = 0
+
+    def write(self, data):
+        self.size += _size(data)
+        return self._stream.write(data)
+
+
+COMPRESSIONS = {"gzip": gzip, "bz2": bz2, "lzma": lzma}
+_compression_extensions = {".gz": "gzip", ".bz2": "bz2", ".xz": "lzma", ".lzma": "lzma"}
+
+
+def open_dump(file, mode="r", *, compress=None):
+    """
+    Open a dump for reading (``"r"``) or writing (``"w"``) as a text stream
+
+    ``file`` is a path or a binary file object. The data is compressed or
+    decompressed while streaming if ``compress`` is one of ``"gzip"``,
+    ``"bz2"`` or ``"lzma"`` or, for paths, if the extension is ``.gz``,
+    ``.bz2``, ``.xz`` or ``.lzma``.
+    """
+    is_path = isinstance(file, (str, os.PathLike))
+    if compress is None and is_path:
+        compress = _compression_extensions.get(os.path.splitext(file)[1])
+    if compress:
+        return COMPRESSIONS[compress].open(file, f"{mode}t", encoding="utf-8")
+    if is_path:
+        return open(file, mode, encoding="utf-8")
+    return io.TextIOWrapper(file, encoding="utf-8")
+
+
+def dump_specs(
+    specs,
+    *,
+    mappers=None,
+    objects=None,
+    version=1,
+    columnar=False,
+    events=silence,
+    trace_memory=False,
+):
     stream = io.StringIO()
-    stream.write('{"version": 1, "specs": ')
-    json.dump(specs, stream, cls=JSONEncoder)
-    stream.write(', "objects": ')
-    serializer = JSONSerializer(mappers=mappers or {})
-    if objects is None:
-        objects = chain.from_iterable(
-            _model_queryset(spec).distinct() for spec in specs
+    write_dump(
+        stream,
+        specs,
+        mappers=mappers,
+        objects=objects,
+        version=version,
+        columnar=columnar,
+        events=events,
+        trace_memory=trace_memory,
+    )
+    return stream.getvalue()
+
+
+def write_dump(
+    stream,
+    specs,
+    *,
+    mappers=None,
+    objects=None,
+    chunk_size=2000,
+    jobs=1,
+    version=1,
+    columnar=False,
+    events=silence,
+    trace_memory=False,
+):
+    """
+    Write the dump to ``stream`` as it is being generated
+
+    Querysets are consumed using ``.iterator(chunk_size=...)`` so that neither
+    the model instances nor the serialized JSON have to be held in memory all
+    at once.
+
+    With ``jobs > 1`` the specs are serialized concurrently by a pool of
+    threads, each using its own database connection. The output is the same
+    as when dumping the specs one after another.
+
+    Version 1 dumps are a single JSON object. Version 2 dumps consist of a
+    header line containing the version and the specs followed by one line per
+    object (JSON Lines). With ``columnar=True`` version 2 dumps contain the
+    field names once per spec and the objects as arrays of values.
+
+    Specs with ``"delta"`` only contain the objects changed since a
+    checkpoint. If they also use ``"delete_missing"``, the primary keys of all
+    objects matching the spec are added to the header as ``"existing"`` so
+    that the loader knows which objects have been deleted.
+
+    ``events`` receives a ``"dump"`` event per spec, see ``_Instrument``.
+    """
+    if version not in {1, 2}:
+        raise InvalidVersionError(f"Invalid dump version {version!r}")
+    if columnar and version != 2:
+        raise InvalidVersionError("The columnar encoding requires version 2 dumps")
+
+    stream = _CountingWriter(stream)
+    instrument = _Instrument(
+        events, size=lambda: stream.size, trace_memory=trace_memory
+    )
+    with instrument.count_queries(DEFAULT_DB_ALIAS):
+        _write_dump(
+            stream,
+            specs,
+            mappers=mappers,
+            objects=objects,
+            chunk_size=chunk_size,
+            jobs=jobs,
+            version=version,
+            columnar=columnar,
+            instrument=instrument,
         )
-    serializer.serialize(objects, stream=stream)
-    return stream.getvalue().rstrip("\n") + "}\n"
 
 
-def load_dump(
-    data, *, progress=silence, ignorenonexistent=False, using=DEFAULT_DB_ALIAS
+def _write_dump(
+    stream,
+    specs,
+    *,
+    mappers,
+    objects,
+    chunk_size,
+    jobs,
+    version,
+    columnar,
+    instrument,
 ):
-    if data["version"] != 1:
+    header = {"version": version, "specs": specs}
+    existing = _existing_pks(specs)
+    if any(pks is not None for pks in existing):
+        header["existing"] = existing
+
+    if version == 1:
+        stream.write(json.dumps(header, cls=JSONEncoder)[:-1])
+        stream.write(', "objects": ')
+        serializer_class = JSONSerializer
+    else:
+        json.dump(header, stream, cls=JSONEncoder)
+        stream.write("\n")
+        serializer_class = ColumnarSerializer if columnar else JSONLSerializer
+
+    if objects is None and jobs > 1:
+        serialized = _serialize_specs_parallel(
+            specs,
+            serializer_class=serializer_class,
+            mappers=mappers,
+            chunk_size=chunk_size,
+            jobs=jobs,
+        )
+        if version == 1:
+            # Join the lists of objects
+            stream.write("[")
+            separator = ""
+            for spool, event in serialized:
+                with spool:
+                    if _copy_spool(spool, stream, separator=separator, strip=True):
+                        separator = ", "
+                instrument.emit(event)
+            stream.write("]")
+        else:
+            for spool, event in serialized:
+                with spool:
+                    _copy_spool(spool, stream)
+                instrument.emit(event)
+    else:
+        serializer = serializer_class(mappers=mappers or {})
+        if objects is not None:
+            serializer.serialize(instrument.iterate("dump", objects), stream=stream)
+        elif version == 1:
+            serializer.serialize(
+                chain.from_iterable(
+                    instrument.iterate(
+                        "dump",
+                        _dump_objects(spec, chunk_size=chunk_size),
+                        model=spec["model"],
+                    )
+                    for spec in specs
+                ),
+                stream=stream,
+            )
+        else:
+            # Serialize specs individually, same as _serialize_specs_parallel
+            for spec in specs:
+                serializer.serialize(
+                    instrument.iterate(
+                        "dump",
+                        _dump_objects(spec, chunk_size=chunk_size),
+                        model=spec["model"],
+                    ),
+                    stream=stream,
+                )
+
+    if version == 1:
+        stream.write("}\n")
+
+
+_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+_COPY_SIZE = 64 * 1024
+
+
+def _serialize_specs_parallel(specs, *, serializer_class, mappers, chunk_size, jobs):
+    """
+    Serialize specs using a thread pool and yield them in order
+
+    On PostgreSQL all workers read from the snapshot of the calling thread.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    with transaction.atomic(using=connection.alias):
+        snapshot = None
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_export_snapshot()")
+                snapshot = cursor.fetchone()[0]
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+
+            def submit(spec):
+                return executor.submit(
+                    _serialize_spec,
+                    spec,
+                    serializer_class=serializer_class,
+                    mappers=mappers,
+                    chunk_size=chunk_size,
+                    snapshot=snapshot,
+                )
+
+            # Submit a few specs ahead of the one being written, but not all
+            # of them, to bound the memory used for serialized specs.
+            specs = iter(specs)
+            futures = deque(submit(spec) for spec in islice(specs, 2 * jobs))
+            while futures:
+                yield futures.popleft().result()
+                if spec := next(specs, None):
+                    futures.append(submit(spec))
+
+
+def _serialize_spec(spec, *, serializer_class, mappers, chunk_size, snapshot):
+    try:
+        with transaction.atomic():
+            if snapshot:
+                with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                    cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot])
+            events = []
+            # Large specs are spilled to disk while waiting to be written; the
+            # caller closes the spool after copying it
+            spool = tempfile.SpooledTemporaryFile(  # noqa: SIM115
+                max_size=_SPOOL_MAX_SIZE, mode="w+", encoding="utf-8"
+            )
+            stream = _CountingWriter(spool)
+            instrument = _Instrument(events.append, size=lambda: stream.size)
+            try:
+                with instrument.count_queries(DEFAULT_DB_ALIAS):
+                    serializer_class(mappers=mappers or {}).serialize(
+                        instrument.iterate(
+                            "dump",
+                            _dump_objects(spec, chunk_size=chunk_size),
+                            model=spec["model"],
+                        ),
+                        stream=stream,
+                    )
+            except BaseException:
+                spool.close()
+                raise
+            return spool, events[0]
+    finally:
+        # Worker threads open their own connections
+        connections.close_all()
+
+
+def _copy_spool(spool, stream, *, separator="", strip=False):
+    """
+    Copy a serialized spec to ``stream``, without the list brackets if
+    ``strip``, and return whether anything has been written
+    """
+    spool.seek(0)
+    if strip:
+        spool.read(1)
+    held = ""
+    written = False
+    while chunk := spool.read(_COPY_SIZE):
+        if strip:
+            # The last character may be the closing bracket
+            chunk, held = held + chunk[:-1], chunk[-1]
+        if chunk:
+            if not written:
+                stream.write(separator)
+                written = True
+            stream.write(chunk)
+    return written
+
+
+def _validate_dump(data):
+    if data.get("version") not in {1, 2}:
         raise InvalidVersionError(f"Invalid dump version {data.get('version')!r}")
+    if "specs" not in data:
+        raise InvalidDumpError("The dump doesn't contain the specs")
     for spec in data["specs"]:
         _validate_spec(spec)
+    existing = data.get("existing") or [None] * len(data["specs"])
+    if len(existing) != len(data["specs"]):
+        raise InvalidDumpError("The dump contains existing pks for unknown specs")
+    for spec, pks in zip(data["specs"], existing):
+        if spec.get("delta") and spec.get("delete_missing") and pks is None:
+            raise InvalidDumpError(
+                f"The delta spec {spec!r} uses 'delete_missing' but the dump"
+                " doesn't contain the existing primary keys"
+            )
 
-    objects = defaultdict(list)
-    seen_pks = defaultdict(set)
 
-    # Yes, that is a bit stupid
-    for ds in serializers.deserialize(
-        "json",
-        json.dumps(data["objects"]),
+def load_dump(
+    data,
+    *,
+    progress=silence,
+    ignorenonexistent=False,
+    using=DEFAULT_DB_ALIAS,
+    bulk=False,
+    batch_size=1000,
+    skip_unchanged=False,
+    events=silence,
+    trace_memory=False,
+    check_constraints="written",
+):
+    _validate_dump(data)
+
+    instrument = _Instrument(events, trace_memory=trace_memory)
+    with instrument.count_queries(using):
+        batches = _deserialize(
+            data,
+            ignorenonexistent=ignorenonexistent,
+            progress=progress,
+            instrument=instrument,
+        )
+        with _transaction(
+            using,
+            progress=progress,
+            instrument=instrument,
+            check_constraints=check_constraints,
+        ) as written:
+            _load(
+                data["specs"],
+                batches,
+                written,
+                existing=data.get("existing"),
+                progress=progress,
+                bulk=bulk,
+                batch_size=batch_size,
+                skip_unchanged=skip_unchanged,
+                instrument=instrument,
+            )
+
+
+def _deserialize(data, *, ignorenonexistent, progress, instrument):
+    """
+    Deserialize all objects of a parsed dump and return the batches per spec
+    """
+    objects = defaultdict(list)
+    loaded = 0
+
+    # The objects have already been parsed, deserialize them directly
+    # instead of encoding them as JSON again. Any iterable of dicts works.
+    with instrument.phase("deserialize") as phase:
+        for ds in serializers.deserialize(
+            "python",
+            _decode_columnar(data["objects"])
+            if data["version"] == 2
+            else data["objects"],
+            ignorenonexistent=ignorenonexistent,
+        ):
+            objects[ds.object._meta.label_lower].append(ds)
+            loaded += 1
+        phase["objects"] = loaded
+
+    progress(f"Loaded {loaded} objects")
+    return _release_batches(data["specs"], objects)
+
+
+def _release_batches(specs, objects):
+    """
+    Yield the objects of each spec and release them after their last spec
+    """
+    last = {spec["model"]: i for i, spec in enumerate(specs)}
+    for i, spec in enumerate(specs):
+        if last[spec["model"]] == i:
+            yield spec, objects.pop(spec["model"], [])
+        else:
+            yield spec, objects[spec["model"]]
+
+
+def load_dump_stream(
+    stream,
+    *,
+    progress=silence,
+    ignorenonexistent=False,
+    using=DEFAULT_DB_ALIAS,
+    bulk=False,
+    batch_size=1000,
+    skip_unchanged=False,
+    events=silence,
+    trace_memory=False,
+    check_constraints="written",
+):
+    """
+    Load a dump from a text stream without parsing it all at once
+
+    The objects are parsed one by one and saved per spec as they arrive, so
+    memory usage depends on the largest spec and not on the size of the whole
+    dump. The dump has to be ordered like the dumps written by
+    ``write_dump``, that is, the ``"version"`` and ``"specs"`` have to come
+    before the objects and the objects have to be grouped by spec. Other dumps
+    are loaded as a whole if the stream is seekable.
+
+    The ``"deserialize"`` events include the time spent parsing the objects.
+    """
+    load_dumps(
+        [stream],
+        progress=progress,
         ignorenonexistent=ignorenonexistent,
-        # handle_forward_references=True,
+        using=using,
+        bulk=bulk,
+        batch_size=batch_size,
+        skip_unchanged=skip_unchanged,
+        events=events,
+        trace_memory=trace_memory,
+        check_constraints=check_constraints,
+    )
+
+
+def load_dumps(
+    streams,
+    *,
+    progress=silence,
+    ignorenonexistent=False,
+    using=DEFAULT_DB_ALIAS,
+    bulk=False,
+    batch_size=1000,
+    skip_unchanged=False,
+    events=silence,
+    trace_memory=False,
+    check_constraints="written",
+):
+    """
+    Load several dumps from text streams in a single transaction
+
+    Each dump is loaded the same way as by ``load_dump_stream``, including
+    deleting missing objects per dump, so the result is the same as when
+    loading the dumps one after the other. Constraints are checked and
+    sequences are reset once after loading all dumps. ``streams`` may be a
+    generator opening the dumps one by one.
+    """
+    readers = []
+    instrument = _Instrument(
+        events,
+        size=lambda: sum(reader.size for reader in readers),
+        trace_memory=trace_memory,
+    )
+    with (
+        instrument.count_queries(using),
+        _transaction(
+            using,
+            progress=progress,
+            instrument=instrument,
+            check_constraints=check_constraints,
+        ) as written,
     ):
-        objects[ds.object._meta.label_lower].append(ds)
-
-    progress(f"Loaded {len(data['objects'])} objects")
+        for stream in streams:
+            readers.append(reader := _DumpReader(stream))
+            with instrument.phase("parse"):
+                try:
+                    data, parsed = reader.header(), False
+                except InvalidDumpError:
+                    # E.g. dumps whose keys have been sorted, load them as a whole
+                    if not stream.seekable():
+                        raise
+                    data, parsed = reader.load(), True
+            _validate_dump(data)
+
+            load = partial(
+                _load,
+                written=written,
+                progress=progress,
+                bulk=bulk,
+                batch_size=batch_size,
+                skip_unchanged=skip_unchanged,
+                instrument=instrument,
+            )
+            if not parsed:
+                batches = _instrument_batches(
+                    _spec_batches(
+                        data["specs"],
+                        serializers.deserialize(
+                            "python",
+                            reader.objects(),
+                            ignorenonexistent=ignorenonexistent,
+                        ),
+                    ),
+                    instrument,
+                )
+                try:
+                    with transaction.atomic(using=using):
+                        load(data["specs"], batches, existing=data.get("existing"))
+                    continue
+                except InvalidDumpError:
+                    # E.g. objects which aren't grouped by spec, roll back and
+                    # load the dump as a whole
+                    if not stream.seekable():
+                        raise
+                with instrument.phase("parse"):
+                    data = reader.load()
+                _validate_dump(data)
+
+            load(
+                data["specs"],
+                _deserialize(
+                    data,
+                    ignorenonexistent=ignorenonexistent,
+                    progress=progress,
+                    instrument=instrument,
+                ),
+                existing=data.get("existing"),
+            )
 
-    save_as_new_models = {
-        spec["model"] for spec in data["specs"] if spec.get("save_as_new")
-    }
 
+def _instrument_batches(batches, instrument):
+    """
+    Report a ``"deserialize"`` event for each batch
+    """
+    batches = iter(batches)
+    while True:
+        start = instrument.start()
+        if (batch := next(batches, None)) is None:
+            return
+        spec, objs = batch
+        instrument.report("deserialize", start, model=spec["model"], objects=len(objs))
+        yield batch
+        del batch, objs
+
+
+@contextmanager
+def _transaction(using, *, progress, instrument, check_constraints):
+    """
+    Load dumps in a transaction with disabled constraint checks
+
+    Yields a dict of the written models and their primary keys.
+    """
+    if check_constraints not in {"written", "tables"}:
+        raise ValueError(f"Invalid check_constraints value {check_constraints!r}")
+
+    written = {}
     with transaction.atomic(using=using):
         connection = connections[using]
         with connection.constraint_checks_disabled():
-            models = set()
-            _load_dump(
-                data,
-                objects,
-                progress,
-                seen_pks,
-                save_as_new_models,
-                models,
-            )
+            yield written
             _finalize(
                 progress,
                 connection,
-                models,
+                list(written),
+                written=written if check_constraints == "written" else None,
+                instrument=instrument,
+            )
+
+
+def _load(
+    specs,
+    batches,
+    written,
+    *,
+    existing=None,
+    progress,
+    bulk,
+    batch_size,
+    skip_unchanged=False,
+    instrument=None,
+):
+    """
+    Load a dump inside ``_transaction`` and add its objects to ``written``
+    """
+    seen_pks = defaultdict(_PrimaryKeys)
+    save_as_new_models = {spec["model"] for spec in specs if spec.get("save_as_new")}
+    models = set()
+    _load_dump(
+        specs,
+        batches,
+        progress,
+        seen_pks,
+        save_as_new_models,
+        models,
+        existing=existing,
+        bulk=bulk,
+        batch_size=batch_size,
+        skip_unchanged=skip_unchanged,
+        instrument=instrument,
+    )
+    for model in models:
+        pks = seen_pks[model._meta.label_lower]
+        if model in written:
+            for pk in pks:
+                written[model].add(pk)
+        else:
+            written[model] = pks
+
+
+def _spec_batches(specs, deserialized):
+    """
+    Group a stream of deserialized objects into ``(spec, objects)`` batches
+
+    Objects of models without a spec are skipped, same as in ``load_dump``.
+    """
+    models = {spec["model"] for spec in specs}
+    remaining = deque(specs)
+    for model, group in groupby(deserialized, lambda ds: ds.object._meta.label_lower):
+        if model not in models:
+            continue
+        while remaining and remaining[0]["model"] != model:
+            yield remaining.popleft(), []
+        if not remaining:
+            raise InvalidDumpError(
+                f"The {model} objects are not ordered by spec and the dump"
+                " cannot be streamed"
             )
+        # The objects of consecutive specs of the same model cannot be told
+        # apart, all of them get all objects like in load_dump
+        objs = list(group)
+        while remaining and remaining[0]["model"] == model:
+            yield remaining.popleft(), objs
+        del objs
+    for spec in remaining:
+        yield spec, []
+
+
+def _decode_columnar(values):
+    """
+    Turn the columns and rows of columnar version 2 dumps into object dicts
+
+    Object dicts are passed through unchanged.
+    """
+    model = columns = None
+    for value in values:
+        if isinstance(value, list):
+            if columns is None:
+                raise InvalidDumpError("Row without preceding columns")
+            yield {
+                "model": model,
+                "pk": value[0],
+                "fields": dict(zip(columns, value[1:])),
+            }
+        elif "columns" in value:
+            model, columns = value["model"], value["columns"]
+        else:
+            yield value
+
+
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+
+class _DumpReader:
+    """Incrementally parse the objects of a JSON dump from a text stream"""
+
+    def __init__(self, stream, *, chunk_size=2**16):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._lines = False
+        #: The UTF-8 encoded size of the data read so far
+        self.size = 0
+
+    def _read(self):
+        if not (chunk := self._stream.read(self._chunk_size)):
+            return False
+        self.size += _size(chunk)
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self._pos = _whitespace.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._read():
+                return self._buffer[self._pos : self._pos + 1]
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise InvalidDumpError(f"Expected one of {chars!r}, got {char!r}")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # The value may be incomplete
+                if not self._read():
+                    raise
+                continue
+            # Numbers may continue in the next chunk
+            if end < len(self._buffer) or not self._read():
+                self._pos = end
+                return value
+
+    def header(self):
+        """
+        Return all top-level keys and values up to the ``"objects"`` list
+        """
+        header = {}
+        self._expect("{")
+        if self._peek() != "}":
+            while True:
+                key = self._value()
+                self._expect(":")
+                if key == "objects":
+                    if "version" not in header or "specs" not in header:
+                        raise InvalidDumpError(
+                            "The dump doesn't contain the version and specs"
+                            " before the objects"
+                        )
+                    self._expect("[")
+                    return header
+                header[key] = self._value()
+                if self._expect(",}") == "}":
+                    break
+        if header.get("version") == 2:
+            # The objects follow the header, one per line
+            self._lines = True
+            return header
+        raise InvalidDumpError("The dump doesn't contain a list of objects")
+
+    def load(self):
+        """
+        Parse the whole dump from the start of a seekable stream
+        """
+        self._stream.seek(0)
+        data = self._stream.read()
+        self.size = _size(data)
+        data = json.loads(data)
+        if "objects" not in data:
+            raise InvalidDumpError("The dump doesn't contain a list of objects")
+        return data
+
+    def objects(self):
+        """
+        Yield the objects one by one, must be called after ``header()``
+        """
+        if self._lines:
+
+            def values():
+                while self._peek():
+                    yield self._value()
+
+            yield from _decode_columnar(values())
+            return
+
+        if self._peek() == "]":
+            self._pos += 1
+        else:
+            while True:
+                yield self._value()
+                if self._expect(",]") == "]":
+                    break
+        # Skip the remaining top-level keys
+        while self._expect(",}") == ",":
+            self._value()
+            self._expect(":")
+            self._value()
 
 
 def _load_dump(
-    data,
-    objects,
+    specs,
+    batches,
     progress,
     seen_pks,
     save_as_new_models,
     models,
+    *,
+    existing=None,
+    bulk=False,
+    batch_size=1000,
+    skip_unchanged=False,
+    instrument=None,
 ):
-    save_as_new_pk_map = defaultdict(dict)
-    ignore_missing_m2m_data = defaultdict(dict)
-    deferred_new_pks = []
-    deferred_values = []
-    deferred_m2m = []
-
-    for spec in data["specs"]:
-        if objs := objects[spec["model"]]:
-            for ds in objs:
-                for field_name in spec.get("ignore_missing_m2m", ()):
-                    ignore_missing_m2m_data[ds][field_name] = ds.m2m_data.pop(
-                        field_name, []
-                    )
-
-                random_value = _random_values()
-                for field_name in spec.get("defer_values", ()):
-                    deferred_values.append(
-                        (ds, field_name, getattr(ds.object, field_name))
-                    )
-                    setattr(ds.object, field_name, next(random_value))
-
+    instrument = instrument or _Instrument(silence)
+    save_as_new_pk_map = defaultdict(_PrimaryKeyMap)
+    deferred = _Deferred()
+    # Many-to-many data is written using bulk queries in bulk mode
+    m2m = _M2MWriter(batch_size=batch_size) if bulk else None
+    plans = _save_plans(save_as_new_models)
+
+    for spec, objs in batches:
+        with instrument.phase("save", model=spec["model"], objects=len(objs)) as phase:
+            changed = objs
+            if skip_unchanged:
+                changed, counts = _changed_objects(objs, plans, batch_size=batch_size)
+                phase.update(counts)
+            bulk_objects = [] if bulk else None
+            bulk_inserts = [] if bulk else None
+            pending = _Deferred()
+            for ds in changed:
+                _defer(
+                    ds,
+                    spec,
+                    ignore_missing_m2m_data=pending.ignore_missing_m2m,
+                    deferred_values=pending.values,
+                )
                 _do_save(
                     ds,
+                    plan=plans(ds.object.__class__),
                     pk_map=save_as_new_pk_map,
-                    save_as_new_models=save_as_new_models,
-                    deferred_new_pks=deferred_new_pks,
-                    deferred_m2m=deferred_m2m,
+                    deferred_new_pks=pending.new_pks,
+                    deferred_m2m=pending.m2m,
+                    bulk_objects=bulk_objects,
+                    bulk_inserts=bulk_inserts,
+                    m2m=m2m,
                 )
-                seen_pks[ds.object._meta.label_lower].add(ds.object.pk)
-                models.add(ds.object.__class__)
 
-        progress(f"Saved {len(objs)} {spec['model']} objects")
+            if bulk_objects:
+                _bulk_save(bulk_objects, batch_size=batch_size, m2m=m2m)
+            if bulk_inserts:
+                _bulk_insert(
+                    bulk_inserts,
+                    pk_map=save_as_new_pk_map,
+                    batch_size=batch_size,
+                    m2m=m2m,
+                )
+            if m2m:
+                m2m.flush()
+            # Only keep compact records, the objects are released after saving
+            deferred.extend(pending)
+
+        for ds in objs:
+            seen_pks[ds.object._meta.label_lower].add(ds.object.pk)
+            models.add(ds.object.__class__)
+
+        if skip_unchanged:
+            progress(
+                f"Saved {spec['model']} objects: {phase['inserted']} inserted,"
+                f" {phase['updated']} updated, {phase['unchanged']} unchanged"
+            )
+        else:
+            progress(f"Saved {len(objs)} {spec['model']} objects")
+
+        # Release the objects before the next spec is deserialized
+        del objs, changed, bulk_objects, bulk_inserts, pending
+
+    with instrument.phase(
+        "deferred", objects=len(deferred.new_pks) + len(deferred.m2m)
+    ):
+        _save_deferred_new_pks(deferred.new_pks, bulk=bulk, batch_size=batch_size)
+        _save_deferred_m2m(deferred.m2m, m2m=m2m, batch_size=batch_size)
+        if m2m:
+            m2m.flush()
+
+    _delete_missing_specs(
+        specs,
+        existing,
+        seen_pks,
+        save_as_new_pk_map,
+        progress=progress,
+        batch_size=batch_size,
+        instrument=instrument,
+    )
+
+    with instrument.phase("m2m", objects=len(deferred.ignore_missing_m2m)):
+        _save_ignore_missing_m2m(
+            deferred.ignore_missing_m2m, m2m=m2m, batch_size=batch_size
+        )
+        if m2m:
+            m2m.flush()
 
-    _save_deferred_new_pks(deferred_new_pks)
-    _save_deferred_m2m(deferred_m2m)
+    with instrument.phase("deferred_values", objects=len(deferred.values)):
+        _save_fields(deferred.values, bulk=bulk, batch_size=batch_size)
 
-    for spec in reversed(data["specs"]):
+
+def _delete_missing_specs(
+    specs,
+    existing,
+    seen_pks,
+    save_as_new_pk_map,
+    *,
+    progress,
+    batch_size,
+    instrument,
+):
+    """Delete the unseen objects of ``delete_missing`` specs, dependents first"""
+    for spec, existing_pks in reversed(
+        list(zip(specs, existing or [None] * len(specs)))
+    ):
         if not spec.get("delete_missing"):
             continue
 
@@ -204,20 +1156,245 @@ def _load_dump(
         else:
             queryset = _model_queryset(spec)
 
-        deleted = queryset.exclude(pk__in=seen_pks[spec["model"]]).delete()
+        seen = seen_pks[spec["model"]]
+        if existing_pks is not None:
+            # Delta specs only contain the changed objects
+            to_python = queryset.model._meta.pk.to_python
+            seen = _PrimaryKeys(chain(seen, (to_python(pk) for pk in existing_pks)))
+        with instrument.phase("delete_missing", model=spec["model"]) as phase:
+            deleted = _delete_missing(queryset, seen, batch_size=batch_size)
+            phase["objects"] = deleted[0]
         if deleted[0]:
             progress(f"Deleted {spec['model']} objects: {deleted}")
 
-    pks = pk_cache()
-    for ds, lists in ignore_missing_m2m_data.items():
-        for field_name, field_pks in lists.items():
-            field = ds.object._meta.get_field(field_name)
-            existing = pks(field.related_model)
-            getattr(ds.object, field_name).set(set(field_pks) & existing)
 
-    for ds, field_name, value in deferred_values:
-        setattr(ds.object, field_name, value)
-        ds.save()
+def _changed_objects(objs, plans, *, batch_size):
+    """
+    Return the objects which are new or differ from their rows and the
+    number of inserted, updated and unchanged objects
+    """
+    changed, counts = [], {"inserted": 0, "updated": 0, "unchanged": 0}
+    for model, group in groupby(objs, lambda ds: ds.object.__class__):
+        plan = plans(model)
+        if plan.save_as_new:
+            model_objs = list(group)
+            changed.extend(model_objs)
+            counts["inserted"] += len(model_objs)
+            continue
+
+        fields = model._meta.local_concrete_fields
+        m2m_fields = [
+            f
+            for f in model._meta.local_many_to_many
+            if f.remote_field.through._meta.auto_created
+        ]
+        for batch in _batched(group, batch_size):
+            pks = [ds.object.pk for ds in batch]
+            rows = {obj.pk: obj for obj in model._base_manager.filter(pk__in=pks)}
+            relations = {}
+            for f in m2m_fields:
+                relations[f.name] = related = defaultdict(set)
+                for pk, related_pk in f.remote_field.through._base_manager.filter(
+                    **{f"{f.m2m_field_name()}__in": pks}
+                ).values_list(f.m2m_field_name(), f.m2m_reverse_field_name()):
+                    related[pk].add(related_pk)
+
+            for ds in batch:
+                if (row := rows.get(ds.object.pk)) is None:
+                    counts["inserted"] += 1
+                elif (
+                    plan.fk_fields
+                    or plan.m2m_fields
+                    or any(
+                        f.value_from_object(ds.object) != f.value_from_object(row)
+                        for f in fields
+                    )
+                    or any(
+                        set(ds.m2m_data[name]) != related[ds.object.pk]
+                        for name, related in relations.items()
+                        if name in ds.m2m_data
+                    )
+                ):
+                    counts["updated"] += 1
+                else:
+                    counts["unchanged"] += 1
+                    continue
+                changed.append(ds)
+    return changed, counts
+
+
+def _defer(ds, spec, *, ignore_missing_m2m_data, deferred_values):
+    """
+    Set aside the values which are only saved after saving all objects
+    """
+    for field_name in spec.get("ignore_missing_m2m", ()):
+        ignore_missing_m2m_data.append(
+            (ds.object, field_name, ds.m2m_data.pop(field_name, []))
+        )
+
+    random_value = _random_values()
+    for field_name in spec.get("defer_values", ()):
+        attname = ds.object._meta.get_field(field_name).attname
+        deferred_values.append((ds.object, attname, getattr(ds.object, attname)))
+        setattr(ds.object, attname, next(random_value))
+
+
+class _Deferred:
+    """
+    Records of the data which is only saved after saving all objects
+
+    Objects are replaced by ``(model, pk)`` keys when the records of a spec
+    are added to the records of the whole load using ``extend()``.
+    """
+
+    def __init__(self):
+        self.new_pks = []
+        self.m2m = []
+        self.values = []
+        self.ignore_missing_m2m = []
+
+    def extend(self, pending):
+        # Saving save_as_new objects assigns their primary keys, only compact
+        # the records afterwards.
+        for name in ["new_pks", "m2m", "values", "ignore_missing_m2m"]:
+            getattr(self, name).extend(
+                ((obj.__class__, obj.pk), *rest)
+                for obj, *rest in getattr(pending, name)
+            )
+
+
+def _instances(keys, *, fetch):
+    """Return instances for ``(model, pk)`` keys, fetching the rows if ``fetch``"""
+    if not fetch:
+        return {key: key[0](pk=key[1]) for key in keys}
+    pks = defaultdict(list)
+    for model, pk in keys:
+        pks[model].append(pk)
+    return {
+        (model, pk): obj
+        for model, model_pks in pks.items()
+        for pk, obj in model._base_manager.in_bulk(model_pks).items()
+    }
+
+
+#: The range of integer primary keys which are stored in ``array("q")``
+_INT64 = range(-(2**63), 2**63)
+
+
+def _is_int64(pk):
+    return type(pk) is int and pk in _INT64
+
+
+class _PrimaryKeys:
+    """
+    A compact set of primary keys
+
+    Integers are kept in a sorted ``array("q")``, other primary keys in a ``set``.
+    """
+
+    def __init__(self, pks=()):
+        self._sorted = array("q")
+        self._unsorted = array("q")
+        self._set = None
+        for pk in pks:
+            self.add(pk)
+
+    def add(self, pk):
+        if self._set is not None:
+            self._set.add(pk)
+        elif type(pk) is not int or pk not in _INT64:
+            self._set = {*self, pk}
+            self._sorted = self._unsorted = None
+        elif not self._sorted or pk > self._sorted[-1]:
+            self._sorted.append(pk)
+        elif pk != self._sorted[-1]:
+            self._unsorted.append(pk)
+
+    def _merge(self):
+        if self._unsorted:
+            merged = merge(self._sorted, sorted(self._unsorted))
+            self._sorted = array("q", (pk for pk, _group in groupby(merged)))
+            self._unsorted = array("q")
+        return self._sorted
+
+    def __contains__(self, pk):
+        if self._set is not None:
+            return pk in self._set
+        if type(pk) is not int:
+            return False
+        pks = self._merge()
+        i = bisect_left(pks, pk)
+        return i < len(pks) and pks[i] == pk
+
+    def __iter__(self):
+        return iter(self._set if self._set is not None else self._merge())
+
+    def __len__(self):
+        return len(self._set if self._set is not None else self._merge())
+
+
+class _PrimaryKeyMap:
+    """A compact mapping of old to new primary keys of ``save_as_new`` objects"""
+
+    def __init__(self):
+        self._keys = array("q")
+        self._values = array("q")
+        self._dict = {}
+
+    def __setitem__(self, key, value):
+        if (
+            _is_int64(key)
+            and _is_int64(value)
+            and (not self._keys or key > self._keys[-1])
+        ):
+            self._keys.append(key)
+            self._values.append(value)
+            self._dict.pop(key, None)
+        else:
+            self._dict[key] = value
+
+    def get(self, key, default=None):
+        if key in self._dict:
+            return self._dict[key]
+        if _is_int64(key):
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                return self._values[i]
+        return default
+
+    def __getitem__(self, key):
+        if (value := self.get(key, _sentinel)) is _sentinel:
+            raise KeyError(key)
+        return value
+
+
+#: Above this number of seen primary keys ``delete_missing`` compares the
+#: existing primary keys in chunks instead of excluding all seen primary keys
+#: in a single query.
+DELETE_MISSING_CHUNKED_THRESHOLD = 10000
+
+
+def _delete_missing(queryset, seen, *, batch_size):
+    """Delete the objects matched by ``queryset`` whose primary key wasn't seen"""
+    max_query_params = connections[queryset.db].features.max_query_params
+    threshold = min(
+        DELETE_MISSING_CHUNKED_THRESHOLD,
+        max_query_params or DELETE_MISSING_CHUNKED_THRESHOLD,
+    )
+    if len(seen) <= threshold:
+        return queryset.exclude(pk__in=seen).delete()
+
+    missing = _PrimaryKeys(
+        pk
+        for pk in queryset.values_list("pk", flat=True).iterator(chunk_size=batch_size)
+        if pk not in seen
+    )
+    total, counts = 0, Counter()
+    for batch in _batched(missing, min(batch_size, threshold)):
+        deleted, per_model = queryset.model._base_manager.filter(pk__in=batch).delete()
+        total += deleted
+        counts.update(per_model)
+    return total, dict(counts)
 
 
 def _map_spec(spec, map, save_as_new_pk_map):
@@ -233,78 +1410,434 @@ def _map_spec(spec, map, save_as_new_pk_map):
     return spec
 
 
-def _save_deferred_new_pks(deferred_new_pks):
-    for ds, f_name, pk_map, fk in deferred_new_pks:
-        setattr(ds.object, f_name, pk_map[fk])
-        ds.save()
+def _save_deferred_new_pks(deferred_new_pks, *, bulk=False, batch_size=1000):
+    _save_fields(
+        ((key, attname, pk_map[fk]) for key, attname, pk_map, fk in deferred_new_pks),
+        bulk=bulk,
+        batch_size=batch_size,
+    )
 
 
-def _save_deferred_m2m(deferred_m2m):
-    for ds, m2m_data, f_name, pk_map in deferred_m2m:
-        if pks := m2m_data.get(f_name):
-            getattr(ds, f_name).set([pk_map[pk] for pk in pks])
+def _save_fields(records, *, bulk, batch_size):
+    """Save ``((model, pk), attname, value)`` records of already saved objects"""
+    for batch in _batched(records, batch_size):
+        attnames = defaultdict(set)
+        for key, attname, _value in batch:
+            attnames[key].add(attname)
+        instances = _instances(attnames, fetch=not bulk)
+        for key, attname, value in batch:
+            setattr(instances[key], attname, value)
+
+        if not bulk:
+            for key, key_attnames in attnames.items():
+                instances[key].save_base(raw=True, update_fields=key_attnames)
+            continue
+
+        groups = defaultdict(list)
+        for key, key_attnames in attnames.items():
+            groups[key[0], frozenset(key_attnames)].append(instances[key])
+        for (model, key_attnames), objs in groups.items():
+            model._base_manager.bulk_update(objs, sorted(key_attnames))
+
+
+def _save_deferred_m2m(deferred_m2m, *, m2m=None, batch_size=1000):
+    records = (record for record in deferred_m2m if record[2] is not None)
+    for batch in _batched(records, batch_size):
+        instances = _instances({record[0] for record in batch}, fetch=not m2m)
+        for key, f_name, pks, pk_map in batch:
+            if m2m:
+                m2m.set(instances[key], f_name, [pk_map[pk] for pk in pks])
+            else:
+                getattr(instances[key], f_name).set([pk_map[pk] for pk in pks])
+
+
+def _save_ignore_missing_m2m(ignore_missing_m2m_data, *, m2m=None, batch_size=1000):
+    # Only check the existence of referenced primary keys, all at once
+    referenced = defaultdict(set)
+    for (model, _pk), field_name, field_pks in ignore_missing_m2m_data:
+        field = model._meta.get_field(field_name)
+        referenced[field.related_model].update(field_pks)
+    pks = pk_cache()
+    existing = {
+        model: pks(model, candidates) for model, candidates in referenced.items()
+    }
+
+    for batch in _batched(ignore_missing_m2m_data, batch_size):
+        instances = _instances({record[0] for record in batch}, fetch=not m2m)
+        for key, field_name, field_pks in batch:
+            field = key[0]._meta.get_field(field_name)
+            values = set(field_pks) & existing[field.related_model]
+            if m2m:
+                m2m.set(instances[key], field_name, values)
+            else:
+                getattr(instances[key], field_name).set(values)
 
 
 def _finalize(
     progress,
     connection,
     models,
+    *,
+    written=None,
+    instrument=None,
 ):
+    """
+    Check the constraints and reset the sequences of the loaded models
+
+    Only the rows in ``written`` are checked if given.
+    """
+    instrument = instrument or _Instrument(silence)
     table_names = [model._meta.db_table for model in models]
-    try:
-        connection.check_constraints(table_names=table_names)
-    except Exception as e:
-        e.args = ("Problem installing fixtures: %s" % e,)
-        raise
+    with instrument.phase("check_constraints"):
+        try:
+            if written is None or connection.vendor == "postgresql":
+                connection.check_constraints(table_names=table_names)
+            else:
+                _check_written_constraints(written)
+        except Exception as e:
+            e.args = ("Problem installing fixtures: %s" % e,)
+            raise
 
     sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
     if sequence_sql:
         progress("Resetting sequences")
-        with connection.cursor() as cursor:
+        with instrument.phase("reset_sequences"), connection.cursor() as cursor:
             for line in sequence_sql:
                 cursor.execute(line)
 
 
-def pk_cache():
+def _check_written_constraints(written, *, batch_size=500):
+    """Check the foreign keys and m2m relations of the written rows"""
+    for model, pks in written.items():
+        checks = [
+            (model, "pk", f)
+            for f in model._meta.local_concrete_fields
+            if f.remote_field and f.db_constraint
+        ]
+        checks.extend(
+            (
+                f.remote_field.through,
+                f.m2m_field_name(),
+                f.remote_field.through._meta.get_field(f.m2m_reverse_field_name()),
+            )
+            for f in model._meta.local_many_to_many
+            if f.remote_field.through._meta.auto_created
+        )
+        for batch in _batched(pks, batch_size):
+            for table_model, lookup, f in checks:
+                invalid = (
+                    table_model._base_manager.filter(
+                        **{f"{lookup}__in": batch, f"{f.attname}__isnull": False}
+                    )
+                    .exclude(
+                        Exists(
+                            f.related_model._base_manager.filter(
+                                **{f.target_field.attname: OuterRef(f.attname)}
+                            )
+                        )
+                    )
+                    .values_list("pk", f.attname)
+                    .first()
+                )
+                if invalid:
+                    raise IntegrityError(
+                        f"The row in table '{table_model._meta.db_table}' with"
+                        f" primary key '{invalid[0]}' has an invalid foreign key:"
+                        f" {table_model._meta.db_table}.{f.column} contains a"
+                        f" value '{invalid[1]}' that does not have a"
+                        " corresponding value in"
+                        f" {f.related_model._meta.db_table}.{f.target_field.column}."
+                    )
+
+
+def pk_cache(*, batch_size=500):
+    """
+    Return a function for checking which primary keys exist in the database
+
+    ``pks(model, candidates)`` returns the subset of ``candidates`` existing in
+    the database. Only candidates which haven't been checked before are
+    queried, in batches. ``pks(model)`` returns all primary keys of the model.
+    """
+    known = defaultdict(dict)
+
     @cache
-    def pks(model):
+    def all_pks(model):
         return set(model._default_manager.values_list("pk", flat=True))
 
+    def pks(model, candidates=None):
+        if candidates is None:
+            return all_pks(model)
+        exists = known[model]
+        unknown = {pk for pk in candidates if pk not in exists}
+        for batch in _batched(unknown, batch_size):
+            found = set(
+                model._default_manager.filter(pk__in=batch).values_list("pk", flat=True)
+            )
+            exists.update((pk, pk in found) for pk in batch)
+        return {pk for pk in candidates if exists[pk]}
+
     return pks
 
 
 _sentinel = object()
 
 
-def _do_save(ds, *, pk_map, save_as_new_models, deferred_new_pks, deferred_m2m):
+_SavePlan = namedtuple(
+    "_SavePlan", ["m2m_fields", "fk_fields", "save_as_new", "bulk", "bulk_insert"]
+)
+
+
+def _save_plans(save_as_new_models):
+    """Return a function computing how objects of a model have to be saved"""
+
+    @cache
+    def plan(model):
+        m2m_fields, fk_fields = [], []
+        for f in model._meta.get_fields():
+            if (
+                f.many_to_many
+                and f.related_model._meta.label_lower in save_as_new_models
+            ):
+                m2m_fields.append(f)
+            elif (
+                f.concrete
+                and f.related_model
+                and f.related_model._meta.label_lower in save_as_new_models
+            ):
+                fk_fields.append(f)
+        bulk = _supports_bulk_save(model)
+        return _SavePlan(
+            m2m_fields,
+            fk_fields,
+            model._meta.label_lower in save_as_new_models,
+            bulk,
+            bulk
+            and connections[
+                router.db_for_write(model)
+            ].features.can_return_rows_from_bulk_insert
+            and all(f.null for f in fk_fields if f.related_model == model),
+        )
+
+    return plan
+
+
+def _do_save(
+    ds,
+    *,
+    plan,
+    pk_map,
+    deferred_new_pks,
+    deferred_m2m,
+    bulk_objects=None,
+    bulk_inserts=None,
+    m2m=None,
+):
     # Map old PKs to new
-    for f in ds.object._meta.get_fields():
-        if f.many_to_many and f.related_model._meta.label_lower in save_as_new_models:
-            # Always defer
-            deferred_m2m.append(
-                (ds.object, ds.m2m_data.copy(), f.name, pk_map[f.related_model])
-            )
+    for f in plan.m2m_fields:
+        # Always defer, don't save the old primary keys in the meantime
+        deferred_m2m.append(
+            (ds.object, f.name, ds.m2m_data.pop(f.name, None), pk_map[f.related_model])
+        )
 
-        elif (
-            f.concrete
-            and f.related_model
-            and f.related_model._meta.label_lower in save_as_new_models
-            and (fk := getattr(ds.object, f.column)) is not None
-        ):
-            if (new_pk := pk_map[f.related_model].get(fk, _sentinel)) is not _sentinel:
-                setattr(ds.object, f.name, new_pk)
-            else:
-                # If foreign key isn't nullable we're toast.
-                setattr(ds.object, f.name, None)
-                # But if it is, we can defer.
-                deferred_new_pks.append((ds, f.name, pk_map[f.related_model], fk))
+    for f in plan.fk_fields:
+        if (fk := getattr(ds.object, f.column)) is None:
+            continue
+        if (new_pk := pk_map[f.related_model].get(fk, _sentinel)) is not _sentinel:
+            setattr(ds.object, f.attname, new_pk)
+        else:
+            # If foreign key isn't nullable we're toast.
+            setattr(ds.object, f.attname, None)
+            # But if it is, we can defer.
+            deferred_new_pks.append((ds.object, f.attname, pk_map[f.related_model], fk))
 
-    if ds.object._meta.label_lower in save_as_new_models:
-        # Do the saving
+    if plan.save_as_new:
         old_pk = ds.object.pk
         ds.object.pk = None
-        ds.save(force_insert=True)
-        pk_map[ds.object.__class__][old_pk] = ds.object
+        if bulk_inserts is not None and plan.bulk_insert:
+            # Inserted later by _bulk_insert
+            bulk_inserts.append((ds, old_pk))
+        else:
+            # Do the saving
+            _save(ds, m2m, force_insert=True)
+            pk_map[ds.object.__class__][old_pk] = ds.object.pk
+
+    elif bulk_objects is not None and plan.bulk:
+        # Saved later by _bulk_save
+        bulk_objects.append(ds)
+
+    else:
+        _save(ds, m2m)
+
 
+def _save(ds, m2m, **kwargs):
+    """
+    Save the deserialized object; collect many-to-many data in ``m2m`` if given
+    """
+    if m2m is None:
+        ds.save(**kwargs)
+    else:
+        m2m_data = ds.m2m_data
+        ds.save(save_m2m=False, **kwargs)
+        m2m.add(ds.object, m2m_data)
+
+
+@cache
+def _supports_bulk_save(model):
+    """
+    Return whether objects of this model can be saved using ``_bulk_save``
+
+    ``bulk_create`` calls ``pre_save`` which raw saves skip.
+    """
+    opts = model._meta
+    return not opts.parents and all(
+        _bulk_safe_pre_save(f) for f in opts.concrete_fields
+    )
+
+
+def _bulk_safe_pre_save(field):
+    """Return whether ``pre_save`` returns deserialized values unchanged"""
+    pre_save = type(field).pre_save
+    if pre_save in {DateField.pre_save, DateTimeField.pre_save, TimeField.pre_save}:
+        return not (field.auto_now or field.auto_now_add)
+    # FileField only saves uncommitted files, deserialized files are committed
+    return pre_save in {Field.pre_save, FileField.pre_save}
+
+
+def _batched(iterable, n):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, n)):
+        yield batch
+
+
+def _bulk_save(dss, *, batch_size, m2m):
+    """Insert or update the deserialized objects of a single model without signals"""
+    model = dss[0].object.__class__
+    manager = model._base_manager
+    features = connections[router.db_for_write(model)].features
+    # Later objects win, same as when saving them one by one.
+    objs = list({ds.object.pk: ds.object for ds in dss}.values())
+    fields = [
+        f.name
+        for f in model._meta.concrete_fields
+        if not f.primary_key and not getattr(f, "generated", False)
+    ]
+
+    if fields and features.supports_update_conflicts_with_target:
+        manager.bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            update_fields=fields,
+            unique_fields=[model._meta.pk.name],
+        )
+    elif fields and features.supports_update_conflicts:
+        manager.bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            update_fields=fields,
+        )
+    elif not fields and features.supports_ignore_conflicts:
+        manager.bulk_create(objs, batch_size=batch_size, ignore_conflicts=True)
     else:
-        ds.save()
+        for batch in _batched(objs, batch_size):
+            existing = set(
+                manager.filter(pk__in=[obj.pk for obj in batch]).values_list(
+                    "pk", flat=True
+                )
+            )
+            if fields and (update := [obj for obj in batch if obj.pk in existing]):
+                manager.bulk_update(update, fields)
+            if create := [obj for obj in batch if obj.pk not in existing]:
+                manager.bulk_create(create)
+
+    for ds in dss:
+        m2m.add(ds.object, ds.m2m_data)
+        # Same as DeserializedObject.save()
+        ds.m2m_data = None
+
+
+def _bulk_insert(inserts, *, pk_map, batch_size, m2m):
+    """Insert ``save_as_new`` objects of a single model and map their primary keys"""
+    model = inserts[0][0].object.__class__
+    model._base_manager.bulk_create(
+        [ds.object for ds, _old_pk in inserts], batch_size=batch_size
+    )
+    for ds, old_pk in inserts:
+        pk_map[model][old_pk] = ds.object.pk
+        m2m.add(ds.object, ds.m2m_data)
+        ds.m2m_data = None
+
+
+class _M2MWriter:
+    """
+    Collect many-to-many memberships and write only the differences in bulk
+
+    ``m2m_changed`` signals are not sent.
+    """
+
+    def __init__(self, *, batch_size):
+        self._batch_size = batch_size
+        self._memberships = defaultdict(dict)
+
+    def set(self, obj, field_name, values):
+        """
+        Replace the memberships of ``obj`` like ``.set(values)`` would
+        """
+        field = obj._meta.get_field(field_name)
+        self._memberships[field][obj.pk] = {getattr(v, "pk", v) for v in values}
+
+    def add(self, obj, m2m_data):
+        """
+        Collect the many-to-many data of a deserialized object
+        """
+        for field_name, values in (m2m_data or {}).items():
+            self.set(obj, field_name, values)
+
+    def flush(self):
+        for field, memberships in self._memberships.items():
+            self._write(field, memberships)
+        self._memberships.clear()
+
+    def _write(self, field, memberships):
+        through = field.remote_field.through
+        source = through._meta.get_field(field.m2m_field_name()).attname
+        target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+
+        for batch in _batched(memberships.items(), self._batch_size):
+            owners = [owner for owner, _values in batch]
+            wanted = {(owner, value) for owner, values in batch for value in values}
+            self._sync(through, source, target, source, owners, wanted)
+            if field.remote_field.symmetrical:
+                # .set() also writes the reverse rows of symmetrical relations
+                self._sync(
+                    through,
+                    source,
+                    target,
+                    target,
+                    owners,
+                    {(value, owner) for owner, value in wanted},
+                )
+
+    def _sync(self, through, source, target, lookup, owners, wanted):
+        """Make the through rows of ``owners`` match the pairs in ``wanted``"""
+        manager = through._base_manager
+        existing = {
+            (source_value, target_value): pk
+            for pk, source_value, target_value in manager.filter(
+                **{f"{lookup}__in": owners}
+            ).values_list("pk", source, target)
+        }
+        for pks in _batched(
+            (pk for key, pk in existing.items() if key not in wanted),
+            self._batch_size,
+        ):
+            manager.filter(pk__in=pks).delete()
+        if missing := wanted - existing.keys():
+            manager.bulk_create(
+                [
+                    through(**{source: source_value, target: target_value})
+                    for source_value, target_value in missing
+                ],
+                batch_size=self._batch_size,
+            )
@@ -0,0 +1,129 @@
+import cProfile
+import io
+import json
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+
+
+def add_stats_arguments(parser):
+    parser.add_argument(
+        "--stats",
+        choices=["table", "json"],
+        help=(
+            "Write the duration, number of queries and size of each phase to"
+            " stderr as a table or as JSON."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help=(
+            "Profile the command using cProfile and write the stats to FILE."
+            " Only the main thread is profiled."
+        ),
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help=(
+            "Trace memory allocations using tracemalloc and report the peak"
+            " memory usage and the top allocations."
+        ),
+    )
+
+
+@contextmanager
+def profiling(stderr, *, profile=None, trace_memory=False):
+    """
+    Profile the block and write a short report to ``stderr``
+    """
+    profiler = cProfile.Profile() if profile else None
+    if trace_memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile)
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(
+                20
+            )
+            stderr.write(stream.getvalue())
+            stderr.write(f"Profile written to {profile}")
+        if trace_memory:
+            # The peak memory usage is reported per phase by Stats
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            stderr.write("Top allocations still held at the end:")
+            for stat in snapshot.statistics("lineno")[:10]:
+                stderr.write(f"  {stat}")
+
+
+class Stats:
+    """
+    Collect the events of dumping and loading and write a summary
+    """
+
+    columns = ("phase", "model", "objects", "queries", "bytes", "duration")
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def totals(self):
+        totals = {
+            key: sum(event.get(key, 0) for event in self.events)
+            for key in ["queries", "bytes", "duration"]
+        }
+        if peaks := [e["memory_peak"] for e in self.events if "memory_peak" in e]:
+            totals["memory_peak"] = max(peaks)
+        return totals
+
+    def write(self, stream, format):
+        if format == "json":
+            stream.write(json.dumps({"events": self.events, **self.totals()}))
+            return
+
+        memory = any("memory_peak" in event for event in self.events)
+        rows = [
+            [
+                event["phase"],
+                event.get("model", ""),
+                event.get("objects", ""),
+                event["queries"],
+                event.get("bytes", ""),
+                f"{event['duration']:.3f}",
+                *([f"{event['memory_peak'] / 2**20:.1f}"] if memory else []),
+            ]
+            for event in self.events
+        ]
+        totals = self.totals()
+        rows.append(
+            [
+                "total",
+                "",
+                "",
+                totals["queries"],
+                totals["bytes"],
+                f"{totals['duration']:.3f}",
+                *([f"{totals['memory_peak'] / 2**20:.1f}"] if memory else []),
+            ]
+        )
+        columns = [*self.columns, *(["memory_peak_mib"] if memory else [])]
+        widths = [
+            max(len(str(value)) for value in column) for column in zip(columns, *rows)
+        ]
+        for row in [columns, *rows]:
+            stream.write(
+                "  ".join(
+                    str(value).ljust(width) if i < 2 else str(value).rjust(width)
+                    for i, (value, width) in enumerate(zip(row, widths))
+                )
+            )
@@ -1,6 +1,13 @@
+import sys
+
 from django.core.management.base import BaseCommand, CommandError
 
-from feincms3_data.data import datasets, dump_specs
+from feincms3_data.data import COMPRESSIONS, datasets, open_dump, write_dump
+from feincms3_data.management.commands._stats import (
+    Stats,
+    add_stats_arguments,
+    profiling,
+)
 
 
 DATASETS = datasets()
@@ -12,6 +19,45 @@ class Command(BaseCommand):
             "dataset",
             help=f"Model dataset which should be dumped. {', '.join(DATASETS)}",
         )
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="Specifies the file to which the output is written.",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of specs which are dumped concurrently.",
+        )
+        parser.add_argument(
+            "--dump-version",
+            type=int,
+            choices=[1, 2],
+            default=1,
+            help=(
+                "Version of the dump format. Version 2 dumps contain one object"
+                " per line."
+            ),
+        )
+        parser.add_argument(
+            "--columnar",
+            action="store_true",
+            help=(
+                "Write field names once per spec and objects as arrays of"
+                " values. Requires --dump-version 2."
+            ),
+        )
+        parser.add_argument(
+            "--compress",
+            choices=list(COMPRESSIONS),
+            help=(
+                "Compress the dump. Determined by the extension of the output"
+                " file by default."
+            ),
+        )
+        add_stats_arguments(parser)
 
     def handle(self, *args, **options):
         dataset, sep, args = options["dataset"].partition(":")
@@ -21,4 +67,37 @@ class Command(BaseCommand):
             raise CommandError(
                 f"Invalid dataset {dataset}; should be one of {', '.join(DATASETS)}"
             ) from None
-        self.stdout.write(dump_specs(ds["specs"](args), mappers=ds.get("mappers")))
+
+        if options["columnar"] and options["dump_version"] != 2:
+            raise CommandError("--columnar requires --dump-version 2")
+
+        specs = ds["specs"](args)
+        stats = Stats()
+        kwargs = {
+            "events": stats,
+            "trace_memory": options["trace_memory"],
+            "mappers": ds.get("mappers"),
+            "jobs": options["jobs"],
+            "version": options["dump_version"],
+            "columnar": options["columnar"],
+        }
+        with profiling(
+            self.stderr,
+            profile=options["profile"],
+            trace_memory=options["trace_memory"],
+        ):
+            if output := options["output"]:
+                with open_dump(output, "w", compress=options["compress"]) as stream:
+                    write_dump(stream, specs, **kwargs)
+            elif options["compress"]:
+                with open_dump(
+                    sys.stdout.buffer, "w", compress=options["compress"]
+                ) as stream:
+                    write_dump(stream, specs, **kwargs)
+            else:
+                # The dump is written in many small pieces, don't add newlines.
+                self.stdout.ending = ""
+                write_dump(self.stdout, specs, **kwargs)
+
+        if options["stats"] or options["trace_memory"]:
+            stats.write(self.stderr, options["stats"] or "table")
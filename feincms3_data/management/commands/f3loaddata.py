@@ -1,9 +1,22 @@
-import json
 import sys
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-from feincms3_data.data import load_dump, silence
+from feincms3_data.data import (
+    COMPRESSIONS,
+    InvalidDumpError,
+    InvalidSpecError,
+    InvalidVersionError,
+    load_dump_stream,
+    load_dumps,
+    open_dump,
+    silence,
+)
+from feincms3_data.management.commands._stats import (
+    Stats,
+    add_stats_arguments,
+    profiling,
+)
 
 
 class Command(BaseCommand):
@@ -19,17 +32,95 @@ class Command(BaseCommand):
                 " currently exist on the model."
             ),
         )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help=(
+                "Save objects using bulk queries. Signals are not sent when"
+                " saving objects in bulk."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of objects saved per bulk query.",
+        )
+        parser.add_argument(
+            "--skip-unchanged",
+            action="store_true",
+            help=(
+                "Only save objects which are new or differ from the objects in"
+                " the database."
+            ),
+        )
+        parser.add_argument(
+            "--check-constraints",
+            choices=["written", "tables"],
+            default="written",
+            help=(
+                "Check the foreign keys of the written rows only (the default)"
+                " or of all rows of the loaded tables."
+            ),
+        )
+        parser.add_argument(
+            "--single-transaction",
+            action="store_true",
+            help=(
+                "Load all dumps in a single transaction and check constraints"
+                " and reset sequences only once at the end."
+            ),
+        )
+        parser.add_argument(
+            "--compress",
+            choices=list(COMPRESSIONS),
+            help=(
+                "Decompress the dumps. Determined by the extension of the dump"
+                " files by default."
+            ),
+        )
+        add_stats_arguments(parser)
         parser.add_argument("args", metavar="dump", nargs="+", help="Dumps.")
 
     def handle(self, *dumps, **options):
+        stats = Stats()
+        kwargs = {
+            "events": stats,
+            "trace_memory": options["trace_memory"],
+            "progress": self.stderr.write if options["verbosity"] >= 2 else silence,
+            "ignorenonexistent": options["ignorenonexistent"],
+            "bulk": options["bulk"],
+            "batch_size": options["batch_size"],
+            "skip_unchanged": options["skip_unchanged"],
+            "check_constraints": options["check_constraints"],
+        }
+        compress = options["compress"]
+        with profiling(
+            self.stderr,
+            profile=options["profile"],
+            trace_memory=options["trace_memory"],
+        ):
+            streams = self.open_dumps(dumps, compress=compress)
+            try:
+                if options["single_transaction"]:
+                    load_dumps(streams, **kwargs)
+                else:
+                    for stream in streams:
+                        load_dump_stream(stream, **kwargs)
+            except (InvalidDumpError, InvalidSpecError, InvalidVersionError) as exc:
+                raise CommandError(f"Invalid dump: {exc}") from exc
+
+        if options["stats"] or options["trace_memory"]:
+            stats.write(self.stderr, options["stats"] or "table")
+
+    def open_dumps(self, dumps, *, compress):
+        """Yield the dumps as text streams, opening them one by one"""
         for dump in dumps:
-            if dump == "-":
-                data = json.loads(sys.stdin.read())
+            if dump == "-" and compress:
+                with open_dump(sys.stdin.buffer, compress=compress) as f:
+                    yield f
+            elif dump == "-":
+                yield sys.stdin
             else:
-                with open(dump, encoding="utf-8") as f:
-                    data = json.load(f)
-            load_dump(
-                data,
-                progress=self.stderr.write if options["verbosity"] >= 2 else silence,
-                ignorenonexistent=options["ignorenonexistent"],
-            )
+                with open_dump(dump, compress=compress) as f:
+                    yield f
@@ -1,12 +1,20 @@
-from django.core.serializers import json
+import json as stdjson
+
+from django.core.serializers import json, jsonl
 from django.db import models
 
 
+#: Objects may carry the primary keys of their many to many relations in this
+#: attribute (a dictionary of field names to lists of primary keys) so that
+#: they don't have to be queried object by object.
+M2M_PKS_ATTRIBUTE = "_feincms3_data_m2m_pks"
+
+
 def identity(data):
     return data
 
 
-class JSONSerializer(json.Serializer):
+class MappersMixin:
     def __init__(self, *, mappers):
         self._mappers = mappers
 
@@ -14,6 +22,48 @@ class JSONSerializer(json.Serializer):
         data = super().get_dump_object(obj)
         return self._mappers.get(data["model"], identity)(data)
 
+    def handle_m2m_field(self, obj, field):
+        pks = getattr(obj, M2M_PKS_ATTRIBUTE, {})
+        if field.name in pks and not self.use_natural_foreign_keys:
+            self._current[field.name] = pks[field.name]
+        else:
+            super().handle_m2m_field(obj, field)
+
+
+class JSONSerializer(MappersMixin, json.Serializer):
+    pass
+
+
+class JSONLSerializer(MappersMixin, jsonl.Serializer):
+    pass
+
+
+class ColumnarSerializer(MappersMixin, jsonl.Serializer):
+    """
+    Serialize objects as rows of values, one per line
+
+    A line containing the model label and the field names precedes the rows
+    whenever the model or the fields change; rows are arrays containing the
+    primary key followed by the field values.
+    """
+
+    def start_serialization(self):
+        super().start_serialization()
+        self._columns = None
+
+    def end_object(self, obj):
+        data = self.get_dump_object(obj)
+        columns = (data["model"], *data["fields"])
+        if columns != self._columns:
+            self._columns = columns
+            self._write_line({"model": data["model"], "columns": columns[1:]})
+        self._write_line([data["pk"], *data["fields"].values()])
+        self._current = None
+
+    def _write_line(self, data):
+        stdjson.dump(data, self.stream, **self.json_kwargs)
+        self.stream.write("\n")
+
 
 class JSONEncoder(json.DjangoJSONEncoder):
     def default(self, o):
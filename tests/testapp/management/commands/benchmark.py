@@ -0,0 +1,313 @@
+import io
+import json
+import platform
+import random
+import sqlite3
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from importlib.metadata import version
+
+import django
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from feincms3_data.data import (
+    _PrimaryKeyMap,
+    _PrimaryKeys,
+    _save_plans,
+    dump_specs,
+    load_dump,
+    load_dump_stream,
+    specs_for_app_models,
+    specs_for_models,
+    write_dump,
+)
+from testapp import synthetic
+from testapp.models import Child1, Child2, Parent, Related, Tag, UniqueSlug
+
+
+BENCHMARKS = {}
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        fn()
+        return time.perf_counter() - start, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@benchmark
+def load(command, options):
+    """Load a dump of parents and children using the different load paths"""
+    parents = Parent.objects.bulk_create(
+        Parent(name=f"p-{i}") for i in range(options["parents"])
+    )
+    Child1.objects.bulk_create(
+        Child1(parent=parent, name=f"c-{i}")
+        for parent in parents
+        for i in range(options["children"])
+    )
+
+    dump = dump_specs(specs_for_app_models("testapp", {"delete_missing": True}))
+    command.stdout.write(
+        f"{Parent.objects.count() + Child1.objects.count()} objects, {len(dump)} bytes"
+    )
+
+    for name, fn in [
+        ("load_dump", lambda: load_dump(json.load(io.StringIO(dump)))),
+        ("load_dump_stream", lambda: load_dump_stream(io.StringIO(dump))),
+        (
+            "load_dump_stream bulk",
+            lambda: load_dump_stream(io.StringIO(dump), bulk=True),
+        ),
+    ]:
+        duration, peak = measure(fn)
+        command.stdout.write(
+            f"{name:<25} {duration:8.3f}s {peak / 2**20:10.1f} MiB peak"
+        )
+
+
+@benchmark
+def formats(command, options):
+    """Compare the size and dump and load durations of the dump formats"""
+    parents = Parent.objects.bulk_create(
+        Parent(name=f"p-{i}") for i in range(options["parents"])
+    )
+    Child1.objects.bulk_create(
+        Child1(parent=parent, name=f"c-{i}")
+        for parent in parents
+        for i in range(options["children"])
+    )
+    specs = specs_for_app_models("testapp", {"delete_missing": True})
+
+    for name, kwargs in [
+        ("version 1", {}),
+        ("version 2", {"version": 2}),
+        ("version 2 columnar", {"version": 2, "columnar": True}),
+    ]:
+        stream = io.StringIO()
+        dump_duration, _peak = measure(
+            lambda kwargs=kwargs, stream=stream: write_dump(stream, specs, **kwargs)
+        )
+        dump = stream.getvalue()
+        load_duration, _peak = measure(
+            lambda dump=dump: load_dump_stream(io.StringIO(dump))
+        )
+        command.stdout.write(
+            f"{name:<25} {len(dump):12} bytes"
+            f" {dump_duration:8.3f}s dump {load_duration:8.3f}s load"
+        )
+
+
+#: Specs of the suite scenarios
+SCENARIOS = {
+    "delete_missing": lambda: [
+        *specs_for_models(
+            [Tag, Parent, Child1, Child2, Related], {"delete_missing": True}
+        ),
+        *specs_for_models(
+            [UniqueSlug], {"delete_missing": True, "defer_values": ["slug"]}
+        ),
+    ],
+    "save_as_new": lambda: [
+        *specs_for_models([Tag]),
+        *specs_for_models([Parent, Child1, Child2, Related], {"save_as_new": True}),
+    ],
+    "m2m": lambda: specs_for_models([Tag, Parent], {"delete_missing": True}),
+}
+
+
+def measure_events(fn):
+    """Run ``fn(events)`` and return the duration, peak memory, queries etc."""
+    events = []
+    duration, peak = measure(lambda: fn(events.append))
+    return {
+        "duration": duration,
+        "peak_memory": peak,
+        "queries": sum(event["queries"] for event in events),
+        "bytes": sum(event.get("bytes", 0) for event in events),
+        "objects": sum(
+            event["objects"]
+            for event in events
+            if event["phase"] in {"dump", "deserialize"}
+        ),
+    }
+
+
+@benchmark
+def suite(command, options):
+    """Dump and load synthetic data of several sizes and scenarios"""
+    results = []
+    for scale in options["scales"]:
+        for scenario, specs in SCENARIOS.items():
+            synthetic.clear()
+            synthetic.generate(scale)
+            specs = specs()  # noqa: PLW2901
+            stream = io.StringIO()
+            dump = measure_events(
+                lambda events, specs=specs, stream=stream: write_dump(
+                    stream, specs, events=events
+                )
+            )
+            results.append({"operation": "dump", **dump})
+
+            for bulk in [False, True]:
+                load = measure_events(
+                    lambda events, bulk=bulk, stream=stream: load_dump_stream(
+                        io.StringIO(stream.getvalue()), bulk=bulk, events=events
+                    )
+                )
+                results.append({"operation": "load bulk" if bulk else "load", **load})
+
+            for result in results[-3:]:
+                result.update(
+                    scale=scale,
+                    scenario=scenario,
+                    objects_per_second=result["objects"] / result["duration"],
+                )
+                command.stdout.write(
+                    f"{scale:>7} {scenario:<15} {result['operation']:<10}"
+                    f" {result['objects']:>7} objects {result['duration']:8.3f}s"
+                    f" {result['objects_per_second']:10.0f}/s"
+                    f" {result['peak_memory'] / 2**20:8.1f} MiB peak"
+                    f" {result['queries']:8} queries"
+                )
+
+    if output := options["output"]:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "date": datetime.now(timezone.utc).isoformat(),
+                    "versions": {
+                        "python": platform.python_version(),
+                        "django": django.get_version(),
+                        "sqlite": sqlite3.sqlite_version,
+                        "feincms3-data": version("feincms3-data"),
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        command.stdout.write(f"Results written to {output}")
+
+
+@benchmark
+def save_plan(command, options):
+    """Introspect a wide model per object vs. once per load"""
+    save_as_new_models = {"auth.group", "auth.permission"}
+    iterations = options["iterations"]
+
+    def per_object():
+        for _i in range(iterations):
+            _save_plans(save_as_new_models)(User)
+
+    def per_load():
+        plans = _save_plans(save_as_new_models)
+        for _i in range(iterations):
+            plans(User)
+
+    for name, fn in [("per object", per_object), ("per load", per_load)]:
+        start = time.perf_counter()
+        fn()
+        duration = time.perf_counter() - start
+        command.stdout.write(
+            f"{name:<25} {duration:8.3f}s"
+            f" {duration / iterations * 1e6:10.2f} µs per object"
+        )
+
+
+@benchmark
+def pks(command, options):
+    """Memory of the seen primary keys and primary key maps of a load"""
+    count = options["pks"]
+    ordered = list(range(1, count + 1))
+    shuffled = random.sample(ordered, count)
+    uuids = [uuid.uuid4() for _i in range(count)]
+
+    def primary_keys(keys):
+        pks = _PrimaryKeys(keys)
+        len(pks)  # Merge the unsorted primary keys
+        return pks
+
+    def pk_map(cls, keys):
+        pk_map = cls()
+        for key in keys:
+            pk_map[key] = key + count
+        return pk_map
+
+    for name, build, keys in [
+        ("set", lambda: set(ordered), ordered),
+        ("_PrimaryKeys", lambda: primary_keys(ordered), ordered),
+        ("_PrimaryKeys shuffled", lambda: primary_keys(shuffled), ordered),
+        ("set uuid", lambda: set(uuids), uuids),
+        ("_PrimaryKeys uuid", lambda: primary_keys(uuids), uuids),
+        ("dict map", lambda: pk_map(dict, ordered), ordered),
+        ("_PrimaryKeyMap", lambda: pk_map(_PrimaryKeyMap, ordered), ordered),
+    ]:
+        result = []
+        duration, peak = measure(
+            lambda build=build, result=result: result.append(build())
+        )
+        # The memory of the primary keys themselves isn't included
+        size = peak / count
+        lookup = (
+            result[0].__getitem__ if "map" in name.lower() else result[0].__contains__
+        )
+        start = time.perf_counter()
+        for key in keys[:: max(1, count // 100000)]:
+            lookup(key)
+        lookups = time.perf_counter() - start
+        command.stdout.write(
+            f"{name:<25} {duration:8.3f}s {size:8.1f} bytes per primary key"
+            f" {lookups:8.3f}s for 100000 lookups"
+        )
+
+
+class Command(BaseCommand):
+    help = "Runs benchmarks using the testapp models."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "benchmarks",
+            nargs="*",
+            help=f"Benchmarks to run, all by default. {', '.join(BENCHMARKS)}",
+        )
+        parser.add_argument("--parents", type=int, default=2000)
+        parser.add_argument("--children", type=int, default=10)
+        parser.add_argument("--iterations", type=int, default=100000)
+        parser.add_argument(
+            "--pks",
+            type=int,
+            default=1000000,
+            help="Number of primary keys of the pks benchmark.",
+        )
+        parser.add_argument(
+            "--scales",
+            type=int,
+            nargs="+",
+            default=[1000, 10000, 100000],
+            help="Numbers of objects generated for the suite.",
+        )
+        parser.add_argument("-o", "--output", help="Write the suite results as JSON.")
+
+    def handle(self, **options):
+        if unknown := set(options["benchmarks"]) - set(BENCHMARKS):
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+        call_command("migrate", run_syncdb=True, verbosity=0)
+
+        for name in options["benchmarks"] or BENCHMARKS:
+            self.stdout.write(f"{name}: {BENCHMARKS[name].__doc__}")
+            BENCHMARKS[name](self, options)
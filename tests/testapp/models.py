@@ -56,3 +56,20 @@ class UniqueSlug(models.Model):
 
 class UniqueSlugMTI(UniqueSlug):
     pass
+
+
+class VisibleManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(visible=True)
+
+
+class Event(models.Model):
+    name = models.CharField(default="name", max_length=20)
+    date = models.DateTimeField()
+    visible = models.BooleanField(default=True)
+    related = models.ManyToManyField("self", symmetrical=False, blank=True)
+
+    objects = VisibleManager()
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,70 @@
+"""
+Generate synthetic data on the testapp models for benchmarks
+"""
+
+from testapp.models import Child1, Child2, Parent, Related, Tag, UniqueSlug
+
+
+#: Objects per model and 10 objects
+DISTRIBUTION = {
+    Tag: 1,
+    Parent: 1,
+    Child1: 4,
+    Child2: 1,
+    Related: 1,
+    UniqueSlug: 2,
+}
+
+#: Tags per parent
+TAGS_PER_PARENT = 3
+
+
+def clear():
+    for model in reversed(DISTRIBUTION):
+        model._base_manager.all().delete()
+
+
+def generate(objects, *, batch_size=1000):
+    """
+    Create about ``objects`` objects spread over the testapp models
+
+    Tags form a binary tree, parents have tags and children of both child
+    models and a related object pointing to them.
+    """
+    count = {model: max(1, objects * n // 10) for model, n in DISTRIBUTION.items()}
+
+    tags = Tag.objects.bulk_create(
+        (Tag(name=f"t-{i}") for i in range(count[Tag])), batch_size=batch_size
+    )
+    for i, tag in enumerate(tags[1:], 1):
+        tag.parent = tags[(i - 1) // 2]
+    Tag.objects.bulk_update(tags, ["parent"], batch_size=batch_size)
+
+    parents = Parent.objects.bulk_create(
+        (Parent(name=f"p-{i}") for i in range(count[Parent])),
+        batch_size=batch_size,
+    )
+    Parent.tags.through.objects.bulk_create(
+        (
+            Parent.tags.through(
+                parent=parent, tag=tags[(i * TAGS_PER_PARENT + j) % len(tags)]
+            )
+            for i, parent in enumerate(parents)
+            for j in range(min(TAGS_PER_PARENT, len(tags)))
+        ),
+        batch_size=batch_size,
+    )
+    for model in [Child1, Child2, Related]:
+        field = "related_to" if model is Related else "parent"
+        model.objects.bulk_create(
+            (
+                model(name=f"c-{i}", **{field: parents[i % len(parents)]})
+                for i in range(count[model])
+            ),
+            batch_size=batch_size,
+        )
+    UniqueSlug.objects.bulk_create(
+        (UniqueSlug(slug=f"slug-{i}") for i in range(count[UniqueSlug])),
+        batch_size=batch_size,
+    )
+    return sum(count.values())
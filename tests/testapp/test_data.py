@@ -1,24 +1,50 @@
+import datetime
+import gc
+import io
 import json
-
-from django.db import models
+import os
+import pstats
+import tempfile
+from copy import deepcopy
+from unittest import mock
+
+from django.core import serializers
+from django.core.management import CommandError, call_command
+from django.core.serializers.base import DeserializedObject
+from django.db import IntegrityError, connection, models
+from django.db.models.signals import m2m_changed, post_save
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext, isolate_apps
 
+from feincms3_data import data
 from feincms3_data.data import (
+    InvalidDumpError,
     InvalidSpecError,
     InvalidVersionError,
+    _DumpReader,
     _map_spec,
+    _PrimaryKeyMap,
+    _PrimaryKeys,
+    _save_plans,
     _validate_spec,
     datasets,
     dump_specs,
     load_dump,
+    load_dump_stream,
+    load_dumps,
+    open_dump,
     pk_cache,
     specs_for_app_models,
     specs_for_derived_models,
     specs_for_models,
+    write_dump,
 )
+from feincms3_data.management.commands._stats import Stats
 from testapp.models import (
     Child,
     Child1,
+    Child2,
+    Event,
     Parent,
     Related,
     Tag,
@@ -76,6 +102,7 @@ class DataTest(TransactionTestCase):
                         {"model": "testapp.related"},
                         {"model": "testapp.uniqueslug"},
                         {"model": "testapp.uniqueslugmti"},
+                        {"model": "testapp.event"},
                     ]
                 }
             },
@@ -102,6 +129,7 @@ class DataTest(TransactionTestCase):
                 {"model": "testapp.related", "delete_missing": True},
                 {"model": "testapp.uniqueslug", "delete_missing": True},
                 {"model": "testapp.uniqueslugmti", "delete_missing": True},
+                {"model": "testapp.event", "delete_missing": True},
             ],
         )
 
@@ -438,6 +466,19 @@ class DataTest(TransactionTestCase):
         with self.assertNumQueries(1):
             self.assertEqual(pks(Parent), set())
 
+    def test_pk_cache_candidates(self):
+        p1, p2, p3 = Parent.objects.bulk_create(Parent() for _ in range(3))
+        missing = p3.pk + 1
+
+        pks = pk_cache(batch_size=2)
+        with self.assertNumQueries(2):
+            self.assertEqual(pks(Parent, [p1.pk, p2.pk, missing]), {p1.pk, p2.pk})
+        with self.assertNumQueries(0):
+            self.assertEqual(pks(Parent, [p1.pk, missing]), {p1.pk})
+        # Only the unknown primary key is queried
+        with self.assertNumQueries(1):
+            self.assertEqual(pks(Parent, [p1.pk, p3.pk]), {p1.pk, p3.pk})
+
     def test_mappers(self):
         specs = specs_for_app_models("testapp")
 
@@ -451,6 +492,7 @@ class DataTest(TransactionTestCase):
                 {"model": "testapp.related"},
                 {"model": "testapp.uniqueslug"},
                 {"model": "testapp.uniqueslugmti"},
+                {"model": "testapp.event"},
             ],
         )
 
@@ -739,11 +781,1227 @@ class DataTest(TransactionTestCase):
     def test_json_format(self):
         """The exact format generated by dump_specs shouldn't change without us noticing"""
 
-        Tag.objects.create(name="Hello")
+        tag = Tag.objects.create(name="Hello")
         specs = [*specs_for_models([Tag])]
         data = dump_specs(specs)
 
         self.assertEqual(
             data,
-            '{"version": 1, "specs": [{"model": "testapp.tag"}], "objects": [{"model": "testapp.tag", "pk": 5, "fields": {"name": "Hello", "parent": null}}]}\n',
+            f'{{"version": 1, "specs": [{{"model": "testapp.tag"}}], "objects": [{{"model": "testapp.tag", "pk": {tag.pk}, "fields": {{"name": "Hello", "parent": null}}}}]}}\n',
+        )
+
+    def test_write_dump(self):
+        """write_dump streams exactly the same data as dump_specs returns"""
+
+        p = Parent.objects.create(name="p")
+        p.tags.add(Tag.objects.create(name="t"))
+        p.child1_set.create(name="c")
+        specs = specs_for_app_models("testapp")
+
+        stream = io.StringIO()
+        write_dump(stream, specs, chunk_size=1)
+        self.assertEqual(stream.getvalue(), dump_specs(specs))
+
+    def test_f3dumpdata(self):
+        Parent.objects.create(name="p")
+        specs = specs_for_app_models("testapp")
+
+        with mock.patch.dict(
+            "feincms3_data.management.commands.f3dumpdata.DATASETS",
+            {"testapp": {"specs": lambda args: specs}},
+        ):
+            stdout = io.StringIO()
+            call_command("f3dumpdata", "testapp", stdout=stdout)
+            self.assertEqual(stdout.getvalue(), dump_specs(specs))
+
+            with tempfile.TemporaryDirectory() as directory:
+                output = os.path.join(directory, "dump.json")
+                call_command("f3dumpdata", "testapp", output=output)
+                with open(output, encoding="utf-8") as f:
+                    self.assertEqual(f.read(), dump_specs(specs))
+
+    def test_dump_reader(self):
+        data = {
+            "version": 1,
+            "specs": [{"model": "testapp.tag"}],
+            "objects": [
+                {"model": "testapp.tag", "pk": 12345, "fields": {"name": "a, ]"}},
+                {"model": "testapp.tag", "pk": 2, "fields": {"name": "b"}},
+            ],
+            "trailing": [1, 2, 3],
+        }
+        for dump in [json.dumps(data), json.dumps(data, indent=2)]:
+            for chunk_size in [1, 7, 2**16]:
+                reader = _DumpReader(io.StringIO(dump), chunk_size=chunk_size)
+                self.assertEqual(
+                    reader.header(),
+                    {"version": 1, "specs": [{"model": "testapp.tag"}]},
+                )
+                self.assertEqual(list(reader.objects()), data["objects"])
+
+        reader = _DumpReader(io.StringIO('{"version": 1, "specs": [], "objects": []}'))
+        self.assertEqual(reader.header(), {"version": 1, "specs": []})
+        self.assertEqual(list(reader.objects()), [])
+
+        with self.assertRaises(InvalidDumpError):
+            _DumpReader(io.StringIO('{"version": 1}')).header()
+
+        # The version and specs have to come first
+        with self.assertRaises(InvalidDumpError):
+            _DumpReader(io.StringIO('{"objects": [], "version": 1}')).header()
+
+        reader = _DumpReader(
+            io.StringIO('{"version": 1, "specs": [], "objects": [{"pk": 1} {"pk": 2}]}')
+        )
+        reader.header()
+        with self.assertRaises(InvalidDumpError):
+            list(reader.objects())
+
+    def test_load_dump_stream(self):
+        t1 = Tag.objects.create(name="t1")
+        p1 = Parent.objects.create(name="p1")
+        p1.tags.add(t1)
+        p1.child1_set.create(name="c1")
+
+        specs = specs_for_app_models("testapp", {"delete_missing": True})
+        dump = dump_specs(specs)
+
+        Parent.objects.create(name="p2")
+        p1.tags.clear()
+        p1.child1_set.all().delete()
+
+        load_dump_stream(io.StringIO(dump))
+
+        self.assertEqual(parent_child1_set(), [("p1", ["c1"])])
+        self.assertEqual(parent_tags(), {"p1": {"t1"}})
+
+    def test_load_dump_stream_sorted_keys(self):
+        Parent.objects.create(name="p1")
+        dump = json.dumps(
+            json.loads(
+                dump_specs(specs_for_models([Parent], {"delete_missing": True}))
+            ),
+            sort_keys=True,
+        )
+        Parent.objects.update(name="p2")
+        Parent.objects.create(name="p3")
+
+        # Seekable streams are loaded as a whole
+        load_dump_stream(io.StringIO(dump))
+        self.assertEqual(list(Parent.objects.values_list("name", flat=True)), ["p1"])
+
+        with self.assertRaises(InvalidDumpError):
+            load_dump_stream(mock.Mock(wraps=io.StringIO(dump), seekable=lambda: False))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dump.json")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(dump)
+            Parent.objects.update(name="p2")
+            call_command("f3loaddata", path)
+            self.assertEqual(
+                list(Parent.objects.values_list("name", flat=True)), ["p1"]
+            )
+
+        with (
+            mock.patch(
+                "sys.stdin", mock.Mock(wraps=io.StringIO(dump), seekable=lambda: False)
+            ),
+            self.assertRaisesMessage(CommandError, "Invalid dump: The dump doesn't"),
+        ):
+            call_command("f3loaddata", "-")
+
+    def test_load_dump_stream_unordered_objects(self):
+        """Seekable dumps whose objects aren't ordered by spec are loaded as a whole"""
+        p1 = Parent.objects.create(name="p1")
+        t1 = Tag.objects.create(name="t1")
+        specs = specs_for_models([Tag, Parent], {"delete_missing": True})
+        dump = dump_specs(specs, objects=[p1, t1])
+        Parent.objects.update(name="p2")
+        Tag.objects.update(name="t2")
+        Tag.objects.create(name="t3")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dump.json")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(dump)
+            call_command("f3loaddata", path)
+
+        self.assertEqual(list(Parent.objects.values_list("name", flat=True)), ["p1"])
+        self.assertEqual(list(Tag.objects.values_list("name", flat=True)), ["t1"])
+
+        with (
+            mock.patch(
+                "sys.stdin", mock.Mock(wraps=io.StringIO(dump), seekable=lambda: False)
+            ),
+            self.assertRaisesMessage(CommandError, "not ordered by spec"),
+        ):
+            call_command("f3loaddata", "-")
+
+    def test_load_dump_stream_same_model_specs(self):
+        t1 = Tag.objects.create(name="t1")
+        t2 = Tag.objects.create(name="t2")
+        specs = [
+            *specs_for_models([Tag], {"filter": {"pk": t1.pk}}),
+            *specs_for_models(
+                [Tag], {"filter": {"pk": t2.pk}, "defer_values": ["name"]}
+            ),
+        ]
+        dump = dump_specs(specs)
+        Tag.objects.update(name="changed")
+
+        # Both specs get all objects, same as in load_dump
+        messages = []
+        load_dump_stream(io.StringIO(dump), progress=messages.append)
+        self.assertEqual(
+            [message for message in messages if message.startswith("Saved")],
+            ["Saved 2 testapp.tag objects", "Saved 2 testapp.tag objects"],
+        )
+        self.assertEqual(
+            list(Tag.objects.order_by("pk").values_list("name", flat=True)),
+            ["t1", "t2"],
+        )
+
+        messages = []
+        load_dump(json.loads(dump), progress=messages.append)
+        self.assertEqual(
+            [message for message in messages if message.startswith("Saved")],
+            ["Saved 2 testapp.tag objects", "Saved 2 testapp.tag objects"],
+        )
+
+    def test_load_dump_stream_invalid(self):
+        Parent.objects.create(name="p1")
+        Tag.objects.create(name="t1")
+
+        specs = specs_for_models([Parent, Tag])
+        data = json.loads(dump_specs(specs))
+        data["objects"].reverse()
+
+        # load_dump doesn't care about the order of objects
+        load_dump(data)
+        # load_dump_stream does when it cannot load the dump as a whole
+        with self.assertRaises(InvalidDumpError):
+            load_dump_stream(
+                mock.Mock(wraps=io.StringIO(json.dumps(data)), seekable=lambda: False)
+            )
+        load_dump_stream(io.StringIO(json.dumps(data)))
+
+        data["version"] = 3
+        with self.assertRaises(InvalidVersionError):
+            load_dump_stream(io.StringIO(json.dumps(data)))
+
+    def test_f3loaddata(self):
+        Parent.objects.create(name="p1")
+        dump = dump_specs(specs_for_models([Parent], {"delete_missing": True}))
+        Parent.objects.create(name="p2")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dump.json")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(dump)
+            call_command("f3loaddata", path)
+
+        self.assertEqual(parent_names(), ["p1"])
+
+    def test_load_dump_objects_iterable(self):
+        """load_dump accepts any iterable of object dicts"""
+        Parent.objects.create(name="p1")
+        data = json.loads(dump_specs(specs_for_models([Parent])))
+        Parent.objects.all().delete()
+
+        messages = []
+        load_dump(
+            {**data, "objects": (obj for obj in data["objects"])},
+            progress=messages.append,
+        )
+
+        self.assertEqual(parent_names(), ["p1"])
+        self.assertEqual(messages[0], "Loaded 1 objects")
+
+    def _bulk_scenario(self, **kwargs):
+        t1 = Tag.objects.create(name="t1")
+        t2 = Tag.objects.create(name="t2", parent=t1)
+        p1 = Parent.objects.create(name="p1")
+        p1.tags.set([t1, t2])
+        p2 = Parent.objects.create(name="p2")
+        p2.child1_set.create(name="c1")
+        UniqueSlug.objects.create(slug="abc")
+        UniqueSlug.objects.create(slug="def")
+
+        specs = [
+            *specs_for_models(
+                [Tag, Parent, Child1, UniqueSlug],
+                {"delete_missing": True},
+            ),
+        ]
+        specs[-1]["defer_values"] = ["slug"]
+        dump = json.loads(dump_specs(specs))
+
+        p1.name = "p1-changed"
+        p1.save()
+        p1.tags.set([t1])
+        p2.delete()
+        Parent.objects.create(name="p3")
+        UniqueSlug.objects.filter(slug="abc").update(slug="tmp")
+        UniqueSlug.objects.filter(slug="def").update(slug="abc")
+        UniqueSlug.objects.filter(slug="tmp").update(slug="def")
+
+        load_dump(dump, bulk=True, batch_size=2, **kwargs)
+
+        self.assertEqual(parent_child1_set(), [("p1", []), ("p2", ["c1"])])
+        self.assertEqual(parent_tags(), {"p1": {"t1", "t2"}, "p2": set()})
+        self.assertEqual(
+            [(t.name, t.parent and t.parent.name) for t in Tag.objects.all()],
+            [("t1", None), ("t2", "t1")],
+        )
+        self.assertEqual(
+            list(UniqueSlug.objects.order_by("pk").values_list("slug", flat=True)),
+            ["abc", "def"],
+        )
+
+    def test_bulk(self):
+        self._bulk_scenario()
+
+    def test_bulk_without_conflict_support(self):
+        with (
+            mock.patch.object(
+                connection.features,
+                "supports_update_conflicts_with_target",
+                new=False,
+            ),
+            mock.patch.object(
+                connection.features, "supports_update_conflicts", new=False
+            ),
+        ):
+            self._bulk_scenario()
+
+    def test_bulk_query_count(self):
+        Parent.objects.bulk_create(Parent(name=f"p{i}") for i in range(20))
+        dump = json.loads(dump_specs(specs_for_models([Parent])))
+
+        # Transaction and constraint checks, one bulk_create query and one
+        # query fetching the existing tags of all parents
+        with self.assertNumQueries(5 + 2):
+            load_dump(dump, bulk=True)
+
+    def test_bulk_pre_save(self):
+        """Fields overriding pre_save fall back to .save()"""
+        Parent.objects.bulk_create(Parent(name=f"p{i}") for i in range(3))
+        dump = json.loads(dump_specs(specs_for_models([Parent])))
+        Parent.objects.update(name="changed")
+
+        data._supports_bulk_save.cache_clear()
+        self.addCleanup(data._supports_bulk_save.cache_clear)
+        with mock.patch.object(
+            models.CharField, "pre_save", lambda self, obj, add: "overwritten"
+        ):
+            load_dump(deepcopy(dump), bulk=True)
+
+        self.assertEqual(
+            list(Parent.objects.values_list("name", flat=True)), ["p0", "p1", "p2"]
+        )
+
+    def test_bulk_date_fields(self):
+        """Date fields without auto_now don't prevent bulk saves"""
+        date = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        Event.objects.bulk_create(Event(name=f"e{i}", date=date) for i in range(3))
+        dump = json.loads(dump_specs(specs_for_models([Event])))
+        Event.objects.update(name="changed", date=date + datetime.timedelta(days=1))
+
+        self.assertTrue(data._supports_bulk_save(Event))
+        with CaptureQueriesContext(connection) as ctx:
+            load_dump(dump, bulk=True)
+        self.assertEqual(
+            [q["sql"].split()[0] for q in ctx.captured_queries].count("INSERT"), 1
+        )
+
+        self.assertEqual(
+            list(Event.objects.values_list("name", "date")),
+            [("e0", date), ("e1", date), ("e2", date)],
+        )
+
+    @isolate_apps("testapp")
+    def test_m2m_writer_symmetrical(self):
+        """Symmetrical relations get the reverse through rows like .set()"""
+
+        class Person(models.Model):
+            friends = models.ManyToManyField("self")
+
+            class Meta:
+                app_label = "testapp"
+
+            def __str__(self):
+                return str(self.pk)
+
+        with connection.schema_editor() as editor:
+            editor.create_model(Person)
+        self.addCleanup(self._delete_model, Person)
+
+        def rows():
+            return set(
+                Person.friends.through.objects.values_list("from_person", "to_person")
+            )
+
+        a, b, c, d = (Person.objects.create() for _ in range(4))
+        a.friends.set([c, d])
+        b.friends.set([c])
+
+        writer = data._M2MWriter(batch_size=1)
+        writer.set(a, "friends", [a, b, d])
+        writer.set(b, "friends", [a])
+        writer.flush()
+        written = rows()
+
+        Person.friends.through.objects.all().delete()
+        a.friends.set([c, d])
+        b.friends.set([c])
+        a.friends.set([a, b, d])
+        b.friends.set([a])
+        self.assertEqual(written, rows())
+        self.assertEqual(
+            written,
+            {
+                (a.pk, a.pk),
+                (a.pk, b.pk),
+                (b.pk, a.pk),
+                (a.pk, d.pk),
+                (d.pk, a.pk),
+            },
+        )
+
+    def _delete_model(self, model):
+        with connection.schema_editor() as editor:
+            editor.delete_model(model)
+
+    def test_bulk_save_as_new_mti(self):
+        """save_as_new and multi-table inheritance fall back to .save()"""
+        UniqueSlugMTI.objects.create(slug="a")
+        Tag.objects.create(name="t")
+        specs = [
+            *specs_for_models([UniqueSlug], {"defer_values": ["slug"]}),
+            *specs_for_models([UniqueSlugMTI]),
+            *specs_for_models([Tag], {"save_as_new": True}),
+        ]
+        dump = json.loads(dump_specs(specs))
+        UniqueSlug.objects.update(slug="b")
+
+        load_dump(dump, bulk=True)
+
+        self.assertEqual(
+            list(UniqueSlugMTI.objects.values_list("slug", flat=True)), ["a"]
+        )
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_bulk_m2m(self):
+        t1 = Tag.objects.create(name="t1")
+        t2 = Tag.objects.create(name="t2")
+        t3 = Tag.objects.create(name="t3")
+        p1 = Parent.objects.create(name="p1")
+        p1.tags.set([t1, t2])
+        p2 = Parent.objects.create(name="p2")
+        p2.tags.set([t2, t3])
+
+        dump = json.loads(
+            dump_specs(specs_for_models([Parent], {"ignore_missing_m2m": ["tags"]}))
+        )
+
+        p1.tags.set([t3])
+        p2.tags.clear()
+        t2.delete()
+
+        load_dump(dump, bulk=True, batch_size=1)
+        self.assertEqual(parent_tags(), {"p1": {"t1"}, "p2": {"t3"}})
+
+        # save_as_new on both sides of the relation
+        dump = json.loads(
+            dump_specs(specs_for_models([Tag, Parent], {"save_as_new": True}))
+        )
+        load_dump(dump, bulk=True)
+        self.assertEqual(
+            [
+                (p.name, [(t.name, t.pk > t3.pk) for t in p.tags.all()])
+                for p in Parent.objects.all()
+            ],
+            [
+                ("p1", [("t1", False)]),
+                ("p2", [("t3", False)]),
+                ("p1", [("t1", True)]),
+                ("p2", [("t3", True)]),
+            ],
+        )
+
+    def test_delete_missing_chunked(self):
+        p1 = Parent.objects.create(name="p1")
+        p1.child2_set.create(name="c1")
+        p2 = Parent.objects.create(name="p2")
+        p3 = Parent.objects.create(name="p3")
+        specs = [
+            *specs_for_models([Parent], {"delete_missing": True}),
+            *specs_for_models([Child2], {"delete_missing": True}),
+        ]
+        dump = json.loads(dump_specs(specs))
+
+        p2.child2_set.create(name="c2")
+        Parent.objects.create(name="p4").child2_set.create(name="c4")
+        p3.delete()
+
+        messages = []
+        with mock.patch("feincms3_data.data.DELETE_MISSING_CHUNKED_THRESHOLD", 1):
+            load_dump(dump, progress=messages.append, batch_size=1)
+
+        self.assertEqual(parent_names(), ["p1", "p2", "p3"])
+        self.assertEqual(
+            list(Child2.objects.values_list("name", flat=True)),
+            ["c1"],
+        )
+        self.assertIn(
+            "Deleted testapp.child2 objects: (2, {'testapp.Child2': 2})",
+            messages,
+        )
+        self.assertIn(
+            "Deleted testapp.parent objects: (1, {'testapp.Parent': 1})",
+            messages,
+        )
+
+    def test_delete_missing_many_pks(self):
+        """More seen primary keys than SQLite allows query parameters"""
+        Parent.objects.bulk_create(Parent(name=f"p{i}") for i in range(1500))
+        dump = json.loads(
+            dump_specs(specs_for_models([Parent], {"delete_missing": True}))
         )
+        Parent.objects.create(name="new")
+
+        load_dump(dump, bulk=True)
+
+        self.assertEqual(Parent.objects.count(), 1500)
+        self.assertFalse(Parent.objects.filter(name="new").exists())
+
+    def test_deferred_saves_only_update_deferred_fields(self):
+        for bulk in [False, True]:
+            with self.subTest(bulk=bulk):
+                Tag.objects.all().delete()
+                t1 = Tag.objects.create(name="t1")
+                t2 = Tag.objects.create(name="t2", parent=t1)
+                t1.parent = t2
+                t1.save()
+                Tag.objects.create(name="t3", parent=t2)
+
+                specs = [*specs_for_models([Tag], {"save_as_new": True})]
+                dump = json.loads(dump_specs(specs))
+
+                with CaptureQueriesContext(connection) as ctx:
+                    load_dump(dump, bulk=bulk)
+
+                updates = [
+                    q["sql"]
+                    for q in ctx.captured_queries
+                    if q["sql"].startswith("UPDATE")
+                ]
+                # t1 refers to the new t2 which didn't exist yet when saving
+                self.assertEqual(len(updates), 1)
+                self.assertNotIn('"name"', updates[0])
+                self.assertCountEqual(
+                    [
+                        [t.name, t.parent.name]
+                        for t in Tag.objects.filter(pk__gt=t2.pk + 1)
+                    ],
+                    [["t1", "t2"], ["t2", "t1"], ["t3", "t2"]],
+                )
+
+    def test_save_plans(self):
+        plans = _save_plans({"testapp.tag", "testapp.parent"})
+
+        plan = plans(Parent)
+        self.assertEqual(plan.m2m_fields, [Parent._meta.get_field("tags")])
+        self.assertEqual(plan.fk_fields, [])
+        self.assertTrue(plan.save_as_new)
+        self.assertIs(plans(Parent), plan)
+
+        plan = plans(Child1)
+        self.assertEqual(plan.m2m_fields, [])
+        self.assertEqual(plan.fk_fields, [Child1._meta.get_field("parent")])
+        self.assertFalse(plan.save_as_new)
+        self.assertTrue(plan.bulk)
+
+        self.assertFalse(plans(UniqueSlugMTI).bulk)
+
+    def test_primary_keys(self):
+        pks = _PrimaryKeys([1, 2, 5, 3, 5, 2**63 - 1, -4, 1])
+        self.assertEqual(list(pks), [-4, 1, 2, 3, 5, 2**63 - 1])
+        self.assertEqual(len(pks), 6)
+        self.assertIn(3, pks)
+        self.assertNotIn(4, pks)
+        self.assertNotIn(2**63, pks)
+        self.assertNotIn("3", pks)
+
+        p1 = Parent.objects.create(name="p1")
+        Parent.objects.create(name="p2")
+        self.assertEqual(
+            list(Parent.objects.filter(pk__in=_PrimaryKeys([2**40, p1.pk]))), [p1]
+        )
+
+        # Other primary keys are kept in a set
+        pks.add("a")
+        self.assertEqual(set(pks), {-4, 1, 2, 3, 5, 2**63 - 1, "a"})
+        self.assertIn("a", pks)
+        self.assertIn(3, pks)
+        self.assertNotIn(4, pks)
+
+        pks = _PrimaryKeys([2**63, 1])
+        self.assertEqual(set(pks), {2**63, 1})
+
+    def test_primary_key_map(self):
+        pk_map = _PrimaryKeyMap()
+        pk_map[1] = 10
+        pk_map[3] = 30
+        pk_map[2] = 20
+        pk_map["a"] = 40
+        pk_map[3] = 31
+        pk_map[4] = 2**63
+
+        self.assertEqual(
+            [pk_map[pk] for pk in [1, 2, 3, "a", 4]], [10, 20, 31, 40, 2**63]
+        )
+        self.assertIsNone(pk_map.get(5))
+        with self.assertRaises(KeyError):
+            pk_map[5]
+
+    def test_bulk_save_as_new(self):
+        t1 = Tag.objects.create(name="t1")
+        t2 = Tag.objects.create(name="t2", parent=t1)
+        Tag.objects.create(name="t3", parent=t2)
+        Tag.objects.create(name="t4", parent=t1)
+        p1 = Parent.objects.create(name="p1")
+        p1.tags.set([t1, t2])
+        p1.child1_set.create(name="c1")
+
+        specs = specs_for_models([Tag, Parent, Child1], {"save_as_new": True})
+        dump = json.loads(dump_specs(specs))
+        old_tags = set(Tag.objects.all())
+
+        with CaptureQueriesContext(connection) as ctx:
+            load_dump(dump, bulk=True)
+
+        inserts = [
+            q["sql"] for q in ctx.captured_queries if q["sql"].startswith("INSERT")
+        ]
+        # One query per model and one for the many to many relation
+        self.assertEqual(len(inserts), 4)
+
+        new_tags = set(Tag.objects.select_related("parent")) - old_tags
+        self.assertCountEqual(
+            [(t.name, t.parent and t.parent.name) for t in new_tags],
+            [("t1", None), ("t2", "t1"), ("t3", "t2"), ("t4", "t1")],
+        )
+        self.assertTrue(all(t.parent is None or t.parent in new_tags for t in new_tags))
+
+        p2 = Parent.objects.latest("pk")
+        self.assertNotEqual(p1.pk, p2.pk)
+        self.assertCountEqual(
+            [t.name for t in p2.tags.all()],
+            ["t1", "t2"],
+        )
+        self.assertTrue(set(p2.tags.all()) <= new_tags)
+        self.assertEqual([c.name for c in p2.child1_set.all()], ["c1"])
+
+    def test_write_dump_jobs(self):
+        """Parallel dumps are identical to sequential dumps"""
+        t1 = Tag.objects.create(name="t1")
+        for i in range(5):
+            p = Parent.objects.create(name=f"p{i}")
+            p.tags.add(t1)
+            p.child1_set.create(name=f"c{i}")
+        specs = [
+            *specs_for_app_models("testapp"),
+            *specs_for_models([Parent], {"filter": {"name": "p3"}}),
+        ]
+
+        def parent_mapper(obj):
+            obj["fields"]["name"] += "-mapped"
+            return obj
+
+        mappers = {"testapp.parent": parent_mapper}
+        for jobs in [2, 4]:
+            with self.subTest(jobs=jobs):
+                stream = io.StringIO()
+                write_dump(stream, specs, mappers=mappers, jobs=jobs)
+                self.assertEqual(stream.getvalue(), dump_specs(specs, mappers=mappers))
+
+        # Serialized specs spilled to disk and copied in small chunks
+        with (
+            mock.patch.object(data, "_SPOOL_MAX_SIZE", 10),
+            mock.patch.object(data, "_COPY_SIZE", 3),
+        ):
+            for version in [1, 2]:
+                with self.subTest(version=version):
+                    stream = io.StringIO()
+                    write_dump(stream, specs, version=version, jobs=2)
+                    self.assertEqual(
+                        stream.getvalue(), dump_specs(specs, version=version)
+                    )
+
+        stream = io.StringIO()
+        write_dump(stream, specs_for_models([Related]), jobs=2)
+        self.assertEqual(stream.getvalue(), dump_specs(specs_for_models([Related])))
+
+    def test_compressed_dumps(self):
+        Parent.objects.create(name="p1")
+        specs = specs_for_models([Parent], {"delete_missing": True})
+        dump = dump_specs(specs)
+
+        with (
+            mock.patch.dict(
+                "feincms3_data.management.commands.f3dumpdata.DATASETS",
+                {"testapp": {"specs": lambda args: specs}},
+            ),
+            tempfile.TemporaryDirectory() as directory,
+        ):
+            for name, compress in [
+                ("dump.json.gz", None),
+                ("dump.json.bz2", None),
+                ("dump.json.xz", None),
+                ("dump.json", "gzip"),
+            ]:
+                with self.subTest(name=name, compress=compress):
+                    path = os.path.join(directory, name)
+                    call_command(
+                        "f3dumpdata", "testapp", output=path, compress=compress
+                    )
+                    with open(path, "rb") as f:
+                        self.assertNotEqual(f.read(1), b"{")
+                    with open_dump(path, compress=compress) as f:
+                        self.assertEqual(f.read(), dump)
+
+                    Parent.objects.create(name="p2")
+                    call_command("f3loaddata", path, compress=compress)
+                    self.assertEqual(parent_names(), ["p1"])
+
+    def test_version_2(self):
+        t1 = Tag.objects.create(name="t1")
+        p1 = Parent.objects.create(name="p1")
+        p1.tags.add(t1)
+        p1.child1_set.create(name="c1")
+        p2 = Parent.objects.create(name="p2")
+        p2.child1_set.create(name="c2")
+
+        specs = specs_for_app_models("testapp", {"delete_missing": True})
+        v1 = json.loads(dump_specs(specs))
+        dump = dump_specs(specs, version=2)
+
+        header, *lines = dump.splitlines()
+        self.assertEqual(json.loads(header), {"version": 2, "specs": specs})
+        self.assertEqual([json.loads(line) for line in lines], v1["objects"])
+
+        stream = io.StringIO()
+        write_dump(stream, specs, version=2, jobs=3)
+        self.assertEqual(stream.getvalue(), dump)
+
+        for chunk_size in [1, 5]:
+            reader = _DumpReader(io.StringIO(dump), chunk_size=chunk_size)
+            self.assertEqual(reader.header(), {"version": 2, "specs": specs})
+            self.assertEqual(list(reader.objects()), v1["objects"])
+
+        Parent.objects.create(name="p3")
+        p1.tags.clear()
+        load_dump_stream(io.StringIO(dump))
+        self.assertEqual(parent_child1_set(), [("p1", ["c1"]), ("p2", ["c2"])])
+        self.assertEqual(parent_tags(), {"p1": {"t1"}, "p2": set()})
+
+        # Dicts work too
+        Parent.objects.create(name="p3")
+        load_dump({"version": 2, "specs": specs, "objects": v1["objects"]})
+        self.assertEqual(parent_names(), ["p1", "p2"])
+
+        with self.assertRaises(InvalidVersionError):
+            dump_specs(specs, version=3)
+
+    def test_version_2_partial(self):
+        """Version 2 dumps can be split by line"""
+        Parent.objects.bulk_create(Parent(name=f"p{i}") for i in range(4))
+        header, *lines = dump_specs(specs_for_models([Parent]), version=2).splitlines(
+            keepends=True
+        )
+        Parent.objects.all().delete()
+
+        load_dump_stream(io.StringIO("".join([header, *lines[:2]])))
+        self.assertEqual(parent_names(), ["p0", "p1"])
+        load_dump_stream(io.StringIO("".join([header, *lines[2:]])))
+        self.assertEqual(parent_names(), ["p0", "p1", "p2", "p3"])
+
+    def test_columnar(self):
+        t1 = Tag.objects.create(name="t1")
+        Tag.objects.create(name="t2", parent=t1)
+        p1 = Parent.objects.create(name="p1")
+        p1.tags.add(t1)
+        p2 = Parent.objects.create(name="p2")
+
+        def parent_mapper(obj):
+            # Objects with differing fields get their own columns line
+            if obj["pk"] == p2.pk:
+                del obj["fields"]["tags"]
+            return obj
+
+        mappers = {"testapp.parent": parent_mapper}
+        specs = [
+            *specs_for_models([Tag, Parent], {"delete_missing": True}),
+            *specs_for_models([Tag], {"filter": {"name": "t2"}}),
+        ]
+        v1 = json.loads(dump_specs(specs, mappers=mappers))
+        dump = dump_specs(specs, mappers=mappers, version=2, columnar=True)
+
+        self.assertEqual(
+            [json.loads(line) for line in dump.splitlines()[1:]],
+            [
+                {"model": "testapp.tag", "columns": ["name", "parent"]},
+                [t1.pk, "t1", None],
+                [t1.pk + 1, "t2", t1.pk],
+                {"model": "testapp.parent", "columns": ["name", "tags"]},
+                [p1.pk, "p1", [t1.pk]],
+                {"model": "testapp.parent", "columns": ["name"]},
+                [p2.pk, "p2"],
+                {"model": "testapp.tag", "columns": ["name", "parent"]},
+                [t1.pk + 1, "t2", t1.pk],
+            ],
+        )
+
+        stream = io.StringIO()
+        write_dump(stream, specs, mappers=mappers, version=2, columnar=True, jobs=2)
+        self.assertEqual(stream.getvalue(), dump)
+
+        reader = _DumpReader(io.StringIO(dump), chunk_size=3)
+        reader.header()
+        self.assertEqual(list(reader.objects()), v1["objects"])
+
+        Parent.objects.create(name="p3")
+        load_dump_stream(io.StringIO(dump))
+        self.assertEqual(parent_tags(), {"p1": {"t1"}, "p2": set()})
+
+        Parent.objects.create(name="p3")
+        header, *lines = dump.splitlines()
+        load_dump({**json.loads(header), "objects": map(json.loads, lines)})
+        self.assertEqual(parent_tags(), {"p1": {"t1"}, "p2": set()})
+
+        with self.assertRaises(InvalidVersionError):
+            dump_specs(specs, columnar=True)
+
+        reader = _DumpReader(io.StringIO('{"version": 2, "specs": []}\n[1, "a"]'))
+        reader.header()
+        with self.assertRaises(InvalidDumpError):
+            list(reader.objects())
+
+    def test_delta(self):
+        a, b, c, d = (Parent.objects.create(name=name) for name in "abcd")
+        specs = specs_for_models(
+            [Parent],
+            {"delete_missing": True, "delta": {"field": "name", "since": "b"}},
+        )
+        d.delete()
+
+        for version in [1, 2]:
+            with self.subTest(version=version):
+                dump = dump_specs(specs, version=version)
+                data = _DumpReader(io.StringIO(dump)).header()
+                self.assertEqual(data["existing"], [[a.pk, b.pk, c.pk]])
+
+                # Only the changed objects are dumped
+                reader = _DumpReader(io.StringIO(dump))
+                reader.header()
+                self.assertEqual([obj["pk"] for obj in reader.objects()], [b.pk, c.pk])
+
+                Parent.objects.filter(pk=a.pk).update(name="a2")
+                Parent.objects.filter(pk=c.pk).update(name="x")
+                Parent.objects.create(name="e")
+                load_dump_stream(io.StringIO(dump))
+                self.assertEqual(parent_names(), ["a2", "b", "c"])
+                Parent.objects.filter(pk=a.pk).update(name="a")
+
+        # Without delete_missing the existing primary keys aren't needed
+        spec = {**specs[0], "delete_missing": False}
+        self.assertNotIn("existing", json.loads(dump_specs([spec])))
+
+        data = json.loads(dump_specs(specs))
+        del data["existing"]
+        with self.assertRaises(InvalidDumpError):
+            load_dump(data)
+
+        with self.assertRaises(InvalidSpecError):
+            _validate_spec({**specs[0], "delta": {"field": "name"}})
+        with self.assertRaises(InvalidSpecError):
+            _validate_spec({**specs[0], "save_as_new": True})
+
+    def test_skip_unchanged(self):
+        t1 = Tag.objects.create(name="t1")
+        t2 = Tag.objects.create(name="t2")
+        p1 = Parent.objects.create(name="p1")
+        p1.tags.set([t1])
+        p2 = Parent.objects.create(name="p2")
+        p3 = Parent.objects.create(name="p3")
+        Child1.objects.create(parent=p1, name="c1")
+
+        specs = specs_for_models([Tag, Parent, Child1], {"delete_missing": True})
+        dump = dump_specs(specs)
+
+        for bulk in [False, True]:
+            with self.subTest(bulk=bulk):
+                Parent.objects.filter(pk=p2.pk).update(name="changed")
+                p1.tags.set([t1, t2])
+                Parent.objects.filter(pk=p3.pk).delete()
+
+                messages = []
+                with CaptureQueriesContext(connection) as ctx:
+                    load_dump_stream(
+                        io.StringIO(dump),
+                        progress=messages.append,
+                        bulk=bulk,
+                        skip_unchanged=True,
+                    )
+
+                self.assertIn(
+                    "Saved testapp.tag objects: 0 inserted, 0 updated, 2 unchanged",
+                    messages,
+                )
+                self.assertIn(
+                    "Saved testapp.parent objects: 1 inserted, 2 updated, 0 unchanged",
+                    messages,
+                )
+                self.assertIn(
+                    "Saved testapp.child1 objects: 0 inserted, 0 updated, 1 unchanged",
+                    messages,
+                )
+                writes = [
+                    query["sql"]
+                    for query in ctx.captured_queries
+                    if query["sql"].startswith(("INSERT", "UPDATE"))
+                ]
+                self.assertFalse(any('testapp_tag"' in sql for sql in writes))
+                self.assertFalse(any("testapp_child1" in sql for sql in writes))
+                self.assertEqual(parent_names(), ["p1", "p2", "p3"])
+                self.assertEqual(
+                    parent_tags(), {"p1": {"t1"}, "p2": set(), "p3": set()}
+                )
+                self.assertEqual(parent_child1_set()[0], ("p1", ["c1"]))
+
+    def test_dump_m2m_query_count(self):
+        tags = [Tag.objects.create(name=f"t{i}") for i in range(3)]
+        specs = specs_for_models([Parent])
+
+        def dump_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                dump = json.loads(dump_specs(specs))
+            return len(ctx), dump
+
+        for i in range(5):
+            Parent.objects.create(name=f"p{i}").tags.set(tags[: i % 4])
+        queries, dump = dump_queries()
+        self.assertEqual(
+            [obj["fields"]["tags"] for obj in dump["objects"]],
+            [[tag.pk for tag in tags[: i % 4]] for i in range(5)],
+        )
+
+        for i in range(20):
+            Parent.objects.create(name=f"p{i}").tags.set(tags)
+        self.assertEqual(dump_queries()[0], queries)
+
+        # The related primary keys are also used when dumping in parallel
+        stream = io.StringIO()
+        write_dump(stream, specs, jobs=2)
+        self.assertEqual(stream.getvalue(), dump_specs(specs))
+
+    def test_dump_m2m_default_manager(self):
+        """Related objects hidden by the default manager aren't dumped"""
+        date = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        e1, e2, e3 = (Event.objects.create(name=f"e{i}", date=date) for i in range(3))
+        e1.related.set([e2, e3])
+        Event.objects.filter(pk=e2.pk).update(visible=False)
+
+        dump = json.loads(dump_specs(specs_for_models([Event])))
+        self.assertEqual(
+            {obj["pk"]: obj["fields"]["related"] for obj in dump["objects"]},
+            {e1.pk: [e3.pk], e3.pk: []},
+        )
+        self.assertEqual(
+            dump["objects"],
+            json.loads(serializers.serialize("json", Event.objects.order_by("pk"))),
+        )
+
+    def test_events(self):
+        p1 = Parent.objects.create(name="p1")
+        p1.tags.add(Tag.objects.create(name="t1"))
+        Child1.objects.create(parent=p1, name="c1")
+        specs = specs_for_models([Tag, Parent, Child1], {"delete_missing": True})
+
+        for jobs in [1, 2]:
+            with self.subTest(jobs=jobs):
+                events = []
+                stream = io.StringIO()
+                write_dump(stream, specs, jobs=jobs, events=events.append)
+                self.assertEqual(
+                    [(e["phase"], e["model"], e["objects"]) for e in events],
+                    [
+                        ("dump", "testapp.tag", 1),
+                        ("dump", "testapp.parent", 1),
+                        ("dump", "testapp.child1", 1),
+                    ],
+                )
+                # Tags and children: 1 query, parents: 1 query + 1 for m2m
+                self.assertEqual([e["queries"] for e in events], [1, 2, 1])
+                self.assertLess(sum(e["bytes"] for e in events), len(stream.getvalue()))
+                self.assertTrue(all(e["duration"] >= 0 for e in events))
+
+        dump = stream.getvalue()
+        events = []
+        load_dump_stream(io.StringIO(dump), events=events.append)
+        self.assertEqual(
+            [(e["phase"], e.get("model")) for e in events],
+            [
+                ("parse", None),
+                ("deserialize", "testapp.tag"),
+                ("save", "testapp.tag"),
+                ("deserialize", "testapp.parent"),
+                ("save", "testapp.parent"),
+                ("deserialize", "testapp.child1"),
+                ("save", "testapp.child1"),
+                ("deferred", None),
+                ("delete_missing", "testapp.child1"),
+                ("delete_missing", "testapp.parent"),
+                ("delete_missing", "testapp.tag"),
+                ("m2m", None),
+                ("deferred_values", None),
+                ("check_constraints", None),
+            ],
+        )
+        self.assertEqual(sum(e["bytes"] for e in events), len(dump))
+        self.assertEqual(
+            sum(e["queries"] for e in events if e["phase"] == "save"),
+            # Update each object, fetch the existing tags
+            4,
+        )
+
+        events = []
+        load_dump(json.loads(dump), events=events.append)
+        self.assertEqual(events[0]["phase"], "deserialize")
+        self.assertEqual(events[0]["objects"], 3)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dump.json")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(dump)
+            stderr = io.StringIO()
+            call_command("f3loaddata", path, stats="json", stderr=stderr)
+            stats = json.loads(stderr.getvalue())
+            self.assertEqual(len(stats["events"]), 14)
+            self.assertEqual(stats["bytes"], len(dump))
+
+            stderr = io.StringIO()
+            call_command("f3loaddata", path, stats="table", stderr=stderr)
+            lines = stderr.getvalue().splitlines()
+            self.assertEqual(lines[0].split(), [*Stats.columns])
+            self.assertEqual(lines[-1].split()[:2], ["total", str(stats["queries"])])
+
+    def test_load_dumps(self):
+        p1 = Parent.objects.create(name="p1")
+        p1.tags.add(t1 := Tag.objects.create(name="t1"))
+        Child1.objects.create(parent=p1, name="c1")
+        dumps = [
+            dump_specs(specs_for_models([Tag, Parent], {"delete_missing": True})),
+            dump_specs(specs_for_models([Child1], {"delete_missing": True})),
+        ]
+
+        Child1.objects.all().delete()
+        Parent.objects.all().delete()
+        Tag.objects.all().delete()
+
+        events = []
+        load_dumps((io.StringIO(dump) for dump in dumps), events=events.append)
+        self.assertEqual(
+            [
+                e["phase"]
+                for e in events
+                if e["phase"] in {"parse", "check_constraints"}
+            ],
+            ["parse", "parse", "check_constraints"],
+        )
+        self.assertEqual(sum(e["bytes"] for e in events), sum(map(len, dumps)))
+        self.assertEqual(
+            [
+                list(model.objects.values_list("pk", flat=True))
+                for model in [Tag, Parent, Child1]
+            ],
+            [[t1.pk], [p1.pk], [p1.child1_set.get().pk]],
+        )
+
+        # All dumps are loaded in one transaction
+        broken = json.loads(dumps[1])
+        broken["objects"][0]["fields"]["parent"] = p1.pk + 1
+        Child1.objects.all().delete()
+        Parent.objects.all().delete()
+        with self.assertRaises(IntegrityError):
+            load_dumps([io.StringIO(dumps[0]), io.StringIO(json.dumps(broken))])
+        self.assertEqual(Parent.objects.count(), 0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, f"dump-{i}.json") for i in range(2)]
+            for path, dump in zip(paths, dumps):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(dump)
+            stderr = io.StringIO()
+            call_command(
+                "f3loaddata",
+                *paths,
+                single_transaction=True,
+                stats="json",
+                stderr=stderr,
+            )
+            stats = json.loads(stderr.getvalue())
+            self.assertEqual(
+                [e["phase"] for e in stats["events"]].count("check_constraints"), 1
+            )
+            self.assertEqual(Child1.objects.count(), 1)
+
+    def test_profile(self):
+        Parent.objects.create(name="p1")
+        specs = specs_for_models([Parent], {"delete_missing": True})
+
+        with tempfile.TemporaryDirectory() as directory:
+            dump = os.path.join(directory, "dump.json")
+            profile = os.path.join(directory, "dump.prof")
+            stderr = io.StringIO()
+            with mock.patch.dict(
+                "feincms3_data.management.commands.f3dumpdata.DATASETS",
+                {"testapp": {"specs": lambda args: specs}},
+            ):
+                call_command(
+                    "f3dumpdata",
+                    "testapp",
+                    output=dump,
+                    profile=profile,
+                    trace_memory=True,
+                    stderr=stderr,
+                )
+            self.assertIn("write_dump", stderr.getvalue())
+            self.assertIn("Top allocations", stderr.getvalue())
+            self.assertIn("memory_peak_mib", stderr.getvalue())
+            self.assertIn(
+                "write_dump",
+                {name for _file, _line, name in pstats.Stats(profile).stats},
+            )
+
+            profile = os.path.join(directory, "load.prof")
+            stderr = io.StringIO()
+            call_command(
+                "f3loaddata",
+                dump,
+                profile=profile,
+                trace_memory=True,
+                stats="json",
+                stderr=stderr,
+            )
+            self.assertIn(
+                "_finalize",
+                {name for _file, _line, name in pstats.Stats(profile).stats},
+            )
+            # The JSON stats are written last
+            stats = json.loads(stderr.getvalue().splitlines()[-1])
+            self.assertTrue(all("memory_peak" in e for e in stats["events"]))
+
+    def test_check_written_constraints(self):
+        p1 = Parent.objects.create(name="p1")
+        Child1.objects.create(parent=p1, name="c1")
+        dump = json.loads(dump_specs(specs_for_models([Parent, Child1])))
+
+        # Invalid foreign keys of written rows are found
+        data = deepcopy(dump)
+        data["objects"][1]["fields"]["parent"] = p1.pk + 100
+        with self.assertRaisesRegex(IntegrityError, "testapp_child1.parent_id"):
+            load_dump(data)
+
+        data = deepcopy(dump)
+        data["objects"][0]["fields"]["tags"] = [42]
+        with self.assertRaisesRegex(IntegrityError, "testapp_parent_tags.tag_id"):
+            load_dump(data)
+
+        # Rows which haven't been written aren't checked
+        t1 = Tag.objects.create(name="t1")
+        t2 = Tag.objects.create(name="t2", parent=t1)
+        with connection.constraint_checks_disabled():
+            Tag.objects.filter(pk=t2.pk).update(parent_id=t2.pk + 100)
+        data = json.loads(
+            dump_specs(specs_for_models([Tag], {"filter": {"pk": t1.pk}}))
+        )
+        load_dump(data)
+        with self.assertRaisesRegex(IntegrityError, "Problem installing fixtures"):
+            load_dump(data, check_constraints="tables")
+
+    def test_deferred_records_are_compact(self):
+        t1 = Tag.objects.create(name="t1")
+        Tag.objects.create(name="t2", parent=t1)
+        Parent.objects.create(name="p1").tags.add(t1)
+        specs = [
+            *specs_for_models([Tag], {"defer_values": ["name"]}),
+            *specs_for_models([Parent], {"ignore_missing_m2m": ["tags"]}),
+        ]
+        dump = dump_specs(specs)
+
+        def live_tags():
+            gc.collect()
+            return [
+                obj
+                for obj in gc.get_objects()
+                if isinstance(obj, DeserializedObject) and isinstance(obj.object, Tag)
+            ]
+
+        save_fields = data._save_fields
+        alive = []
+
+        def _save_fields(records, **kwargs):
+            alive.append(live_tags())
+            return save_fields(records, **kwargs)
+
+        for loader in [
+            lambda: load_dump_stream(io.StringIO(dump)),
+            lambda: load_dump(json.loads(dump)),
+        ]:
+            with mock.patch.object(data, "_save_fields", _save_fields):
+                loader()
+            # The deserialized tags have been released before saving the
+            # deferred values
+            self.assertEqual(alive.pop(), [])
+            self.assertEqual(
+                set(Tag.objects.values_list("name", flat=True)), {"t1", "t2"}
+            )
+            self.assertEqual(parent_tags(), {"p1": {"t1"}})
+
+    def test_deferred_saves_send_signals_with_rows(self):
+        t1 = Tag.objects.create(name="t1")
+        Tag.objects.create(name="t2", parent=t1)
+        Parent.objects.create(name="p1").tags.add(t1)
+        specs = [
+            *specs_for_models([Tag], {"save_as_new": True}),
+            *specs_for_models([Parent], {"ignore_missing_m2m": ["tags"]}),
+        ]
+        dump = json.loads(dump_specs(specs))
+        # Save the child first so that its parent is deferred
+        dump["objects"][:2] = reversed(dump["objects"][:2])
+        Parent.objects.get().tags.clear()
+
+        saved = []
+        changed = []
+
+        def on_post_save(instance, update_fields, **kwargs):
+            if update_fields:
+                saved.append((instance.name, set(update_fields)))
+
+        def on_m2m_changed(instance, action, **kwargs):
+            changed.append((instance.name, action))
+
+        post_save.connect(on_post_save, sender=Tag)
+        m2m_changed.connect(on_m2m_changed, sender=Parent.tags.through)
+        self.addCleanup(post_save.disconnect, on_post_save, sender=Tag)
+        self.addCleanup(
+            m2m_changed.disconnect, on_m2m_changed, sender=Parent.tags.through
+        )
+
+        load_dump(dump)
+
+        self.assertEqual(saved, [("t2", {"parent_id"})])
+        self.assertEqual(changed, [("p1", "pre_add"), ("p1", "post_add")])
@@ -0,0 +1,107 @@
+import io
+from itertools import pairwise
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from feincms3_data.data import dump_specs, load_dump_stream, specs_for_models
+from testapp import synthetic
+from testapp.models import Child1, Child2, Parent, Related, Tag, UniqueSlug
+
+
+MODELS = [Tag, Parent, Child1, Child2, Related, UniqueSlug]
+
+
+def delete_missing_with_map():
+    return [
+        *specs_for_models([Tag]),
+        *specs_for_models([Parent], {"save_as_new": True}),
+        *specs_for_models(
+            [Child1],
+            {
+                "filter": {
+                    "parent__in": list(Parent.objects.values_list("pk", flat=True))
+                },
+                "save_as_new": True,
+                "delete_missing": {"map": [["parent__in", "testapp.parent"]]},
+            },
+        ),
+    ]
+
+
+#: The specs of each scenario
+SCENARIOS = {
+    "plain": lambda: specs_for_models(MODELS),
+    "delete_missing": lambda: specs_for_models(MODELS, {"delete_missing": True}),
+    "save_as_new": lambda: [
+        *specs_for_models([Tag]),
+        *specs_for_models([Parent, Child1, Child2, Related], {"save_as_new": True}),
+    ],
+    "defer_values": lambda: specs_for_models([UniqueSlug], {"defer_values": ["slug"]}),
+    "ignore_missing_m2m": lambda: [
+        *specs_for_models([Tag]),
+        *specs_for_models([Parent], {"ignore_missing_m2m": ["tags"]}),
+    ],
+    "delete_missing_with_map": delete_missing_with_map,
+}
+
+#: Additional queries per generated object (``testapp.synthetic``) of each
+#: scenario and operation. Dumps and bulk loads (with batches larger than the
+#: generated data) use a constant number of queries.
+BUDGETS = {
+    "plain": {"dump": 0, "load": 1.1, "load bulk": 0},
+    "delete_missing": {"dump": 0, "load": 1.1, "load bulk": 0},
+    "save_as_new": {"dump": 0, "load": 1.0, "load bulk": 0},
+    "defer_values": {"dump": 0, "load": 0.4, "load bulk": 0},
+    "ignore_missing_m2m": {"dump": 0, "load": 0.3, "load bulk": 0},
+    "delete_missing_with_map": {"dump": 0, "load": 0.8, "load bulk": 0},
+}
+
+
+class QueryBudgetTest(TransactionTestCase):
+    """
+    Guard how the number of queries grows with the number of objects
+
+    Each scenario is dumped and loaded with synthetic data of increasing size.
+    The query counts have to grow linearly, by exactly the budgeted number of
+    queries per object.
+    """
+
+    sizes = (20, 40, 80)
+
+    def count_queries(self, scenario, operation):
+        counts = []
+        for size in self.sizes:
+            synthetic.clear()
+            synthetic.generate(size)
+            specs = SCENARIOS[scenario]()
+
+            with CaptureQueriesContext(connection) as ctx:
+                dump = dump_specs(specs)
+            if operation != "dump":
+                with CaptureQueriesContext(connection) as ctx:
+                    load_dump_stream(
+                        io.StringIO(dump),
+                        bulk=operation == "load bulk",
+                        batch_size=1000,
+                    )
+            counts.append(len(ctx))
+        return counts
+
+    def test_query_budgets(self):
+        for scenario, budgets in BUDGETS.items():
+            for operation, per_object in budgets.items():
+                with self.subTest(scenario=scenario, operation=operation):
+                    counts = self.count_queries(scenario, operation)
+                    slopes = [
+                        (c2 - c1) / (s2 - s1)
+                        for (s1, c1), (s2, c2) in pairwise(zip(self.sizes, counts))
+                    ]
+                    self.assertEqual(
+                        [round(slope, 6) for slope in slopes],
+                        [per_object] * len(slopes),
+                        f"{operation} of {scenario!r} should use {per_object}"
+                        f" additional queries per object, query counts for"
+                        f" {self.sizes} objects: {counts}",
+                    )